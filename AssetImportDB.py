@@ -0,0 +1,709 @@
+"""
+Master sheet importer shared by the stencil, pallet and router apps.
+
+Everything is driven by a schema made from an app's ALL_FIELDS (make_schema):
+the sheet columns are "ID" plus the upper-cased field names, and the SQL for
+<kind>_list / <kind>_history is generated from the same list. The per-app
+modules (StencilappDB.py, PalletappDB.py, RouterappDB.py) only declare their
+schema and call main().
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import sqlite3
+import datetime
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import openpyxl
+import numpy as np
+import pandas as pd
+
+# Exit codes of the command line (argparse itself exits with 2 on bad arguments)
+EXIT_OK = 0
+EXIT_IMPORT_FAILED = 1
+EXIT_FILE_NOT_FOUND = 3
+EXIT_BAD_SHEET = 4
+
+BATCH_SIZE = 5000  # rows per batch/commit in streaming mode
+SHEET_EXTENSIONS = (".xlsx", ".xlsm", ".xls", ".csv")
+SAMPLE_CHANGES = 20  # changed cells listed in a dry-run report
+# Text dates are stored as YYYY-MM-DD when they match one of these (numeric ones
+# day first, same list as DATE_FORMATS in the apps); others are kept as typed.
+DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y",
+                "%d/%m/%y", "%d-%m-%y", "%d-%b-%Y", "%d %b %Y", "%d-%b-%y", "%d %B %Y", "%b %d, %Y")
+
+
+def make_schema(kind, fields, unique=None):
+    """
+    Import schema for <kind>_list from the app's ALL_FIELDS. unique names the
+    field that may not repeat across rows (stencil_no); blank values of it are
+    stored as NULL.
+    """
+    columns = ["ID"] + [f.upper() for f in fields]
+    return {
+        "kind": kind,
+        "table": f"{kind}_list",
+        "history": f"{kind}_history",
+        "columns": columns,
+        "data_cols": columns[1:],
+        "date_cols": [c for c in columns[1:] if "DATE" in c or c.endswith("_DT")],
+        "unique": unique.upper() if unique else None,
+    }
+
+
+def map_columns(schema, df):
+    """
+    Match the sheet's headers to the schema, ignoring case and spaces or dashes
+    ("Stencil No" -> STENCIL_NO). Returns the frame with exactly the schema's
+    columns; raises ValueError naming the missing ones.
+    """
+    wanted, rename = set(schema["columns"]), {}
+    for header in df.columns:
+        key = re.sub(r"[\s\-]+", "_", str(header).strip()).upper()
+        if key in wanted and key not in rename.values():
+            rename[header] = key
+    missing = [c for c in schema["columns"] if c not in rename.values()]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    return df[list(rename)].rename(columns=rename)[schema["columns"]]
+
+
+def iso_dates(s):
+    """
+    Text dates as YYYY-MM-DD, one vectorised parse per DATE_FORMATS entry
+    (CSV "2025-01-01 00:00:00", "01/02/2025", "1-FEB-2025"...); others unchanged.
+    """
+    out = s.copy()
+    todo = s.notna() & ~s.astype(str).str.fullmatch(r"\d{4}-\d{2}-\d{2}")
+    for fmt in DATE_FORMATS:
+        if not todo.any():
+            break
+        parsed = pd.to_datetime(s[todo], format=fmt, errors="coerce")
+        ok = parsed.notna()
+        out.loc[ok[ok].index] = parsed[ok].dt.strftime("%Y-%m-%d")
+        todo &= ~todo.index.isin(ok[ok].index)
+    return out
+
+
+def number_text(s):
+    """
+    Numbers as the text the TEXT columns hold: 40.0 -> '40', 40.5 -> '40.5'.
+    A numeric column with a blank cell arrives as float, and '40' != '40.0'
+    would make every such cell look changed.
+    """
+    num = pd.to_numeric(s, errors="coerce")
+    integral = num.notna() & (num % 1 == 0)
+    out = num.astype(object).where(num.notna(), None)
+    out = out.mask(num.notna() & ~integral, num[num.notna() & ~integral].astype(str))
+    return out.mask(integral, num[integral].astype("int64").astype(str))
+
+
+def prepare_frame(schema, df):
+    """
+    Clean the sheet column by column (no per-row Python loop):
+    strings upper-cased and stripped, dates as YYYY-MM-DD, numbers as canonical
+    text (number_text), NaN/NaT as None, ID as int.
+    Returns (frame of importable rows, number of rows without a valid ID).
+    """
+    df = map_columns(schema, df).copy()
+    for col in schema["data_cols"]:
+        s = df[col]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            df[col] = s.dt.strftime("%Y-%m-%d")
+        elif pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            df[col] = number_text(s)
+        elif s.dtype == object or pd.api.types.is_string_dtype(s):
+            is_str = s.map(type) == str
+            if is_str.any():
+                s = s.mask(is_str, s.str.upper().str.strip())
+                # CSV exports of float columns: "40.0" is the number 40, stored as '40'
+                s = s.mask(is_str, s.str.replace(r"^(-?\d+)\.0+$", r"\1", regex=True))
+                if col in schema["date_cols"]:
+                    s = s.mask(is_str, iso_dates(s.where(is_str)))
+            is_ts = s.map(type).isin([pd.Timestamp, datetime.datetime])
+            if is_ts.any():
+                s = s.mask(is_ts, pd.to_datetime(s.where(is_ts)).dt.strftime("%Y-%m-%d"))
+            # openpyxl gives int/float cells in an otherwise text column
+            is_num = s.map(type).isin([int, float, np.int64, np.float64])
+            if is_num.any():
+                s = s.mask(is_num, number_text(s.where(is_num)))
+            df[col] = s
+
+    ids = pd.to_numeric(df["ID"], errors="coerce")
+    valid = ids.notna() & (ids % 1 == 0)
+    df = df[valid].copy()
+    df["ID"] = ids[valid].astype("int64")
+    df = df.astype(object).where(df.notna(), None)
+    if schema["unique"]:
+        # blank values of the unique field are stored as NULL (it is only unique when set)
+        df.loc[df[schema["unique"]] == "", schema["unique"]] = None
+    return df, int((~valid).sum())
+
+
+def unique_conflicts(conn, schema, df, touched):
+    """
+    Rows that would break the unique field: a value repeated within df, or one
+    already held by a row outside `touched` (the IDs this import rewrites).
+    A skipped row keeps its current value, so the check repeats until no more
+    rows drop out. Returns a boolean mask over df; apply_diff can write the rest
+    in any order.
+    """
+    col = schema["unique"]
+    numbered = df[col].notna()
+    bad = numbered & df[col].duplicated(keep="first")
+    held = dict(conn.execute(
+        f"SELECT {col.lower()}, id FROM {schema['table']} WHERE {col.lower()} IN (SELECT value FROM json_each(?))",
+        (json.dumps(df.loc[numbered, col].tolist()),)))
+    holder = df[col].map(held)
+    claims = numbered & holder.notna() & (holder != df["ID"])
+    while True:
+        rewritten = set(touched) - set(df.loc[bad, "ID"])
+        taken = claims & ~holder.isin(rewritten)
+        if not (taken & ~bad).any():
+            return bad
+        bad |= taken
+
+
+def load_current(conn, schema, ids):
+    """Current rows for the given IDs, indexed by ID, with the sheet's column names."""
+    current = pd.read_sql_query(
+        f"SELECT id, {', '.join(c.lower() for c in schema['data_cols'])} FROM {schema['table']} "
+        "WHERE id IN (SELECT value FROM json_each(?))",
+        conn, params=(json.dumps([int(i) for i in ids]),))
+    current.columns = schema["columns"]
+    return current.set_index("ID")
+
+
+def as_text(frame):
+    """Values as they are compared: None/NaN -> '' and everything else str()."""
+    return frame.astype(object).where(frame.notna(), "").astype(str)
+
+
+def diff_frame(conn, schema, df):
+    """
+    Compare prepared sheet rows with the table, whole columns at a time.
+    Returns (rows to insert, changed cells as [ID, COLUMN, OLD, NEW], unchanged row count).
+    """
+    data_cols = schema["data_cols"]
+    current = load_current(conn, schema, df["ID"])
+    incoming = df.set_index("ID")
+    both = incoming.index[incoming.index.isin(current.index)]
+    old_vals = current.loc[both, data_cols]
+    new_vals = incoming.loc[both, data_cols]
+    mask = as_text(old_vals).values != as_text(new_vals).values
+    rows, cols = mask.nonzero()
+    changes = pd.DataFrame({
+        "ID": both.values[rows].tolist(),
+        "COLUMN": np.array(data_cols)[cols],
+        "OLD": old_vals.values[rows, cols],
+        "NEW": new_vals.values[rows, cols],
+    })
+    unchanged = int(len(both) - mask.any(axis=1).sum())
+    return df[~df["ID"].isin(current.index)], changes, unchanged
+
+
+def apply_diff(conn, schema, inserts, changes):
+    """
+    Insert the new rows and UPDATE only the changed cells, one executemany per
+    column, plus their history rows (unless the database's own history triggers
+    write them). Runs inside the caller's transaction.
+
+    Rows whose unique field changes are first parked at NULL, so chain renames,
+    swaps and inserts reusing a number freed in the same sheet never hit the
+    unique index half way (unique_conflicts has already ruled out real clashes).
+    """
+    table, history, columns = schema["table"], schema["history"], schema["columns"]
+    history_insert = f"INSERT INTO {history} ({schema['kind']}_id, changed_column, old_value, new_value) VALUES (?,?,?,?)"
+    has_triggers = conn.execute(
+        f"SELECT 1 FROM sqlite_master WHERE type='trigger' AND name LIKE 'trg_{history}_%'").fetchone()
+    has_history = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (history,)).fetchone()
+    unique = schema["unique"]
+    moved = changes[changes["COLUMN"] == unique] if unique else changes.iloc[:0]
+    last_history = (lambda: conn.execute(f"SELECT IFNULL(MAX(rowid), 0) FROM {history}").fetchone()[0]
+                    if has_history else 0)
+    if not moved.empty:
+        parked_from = last_history()
+        conn.executemany(f"UPDATE {table} SET {unique.lower()}=NULL WHERE id=?", [(i,) for i in moved["ID"].tolist()])
+        parked_to = last_history()
+
+    conn.executemany(f"""
+        INSERT INTO {table} ({', '.join(c.lower() for c in columns)})
+        VALUES ({', '.join(['?'] * len(columns))})
+    """, inserts[columns].itertuples(index=False, name=None))
+    if changes.empty:
+        return
+    for col, grp in changes.groupby("COLUMN", sort=False):
+        conn.executemany(f"UPDATE {table} SET {col.lower()}=? WHERE id=?",
+                         zip(grp["NEW"].tolist(), grp["ID"].tolist()))
+    table_cols = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+    touch = "updated_at=CURRENT_TIMESTAMP" + (", row_version=row_version+1" if "row_version" in table_cols else "")
+    conn.executemany(f"UPDATE {table} SET {touch} WHERE id=?",
+                     [(i,) for i in changes["ID"].unique().tolist()])
+
+    if has_history and not has_triggers:
+        conn.executemany(history_insert, zip(changes["ID"].tolist(), changes["COLUMN"].str.lower(),
+                                             changes["OLD"].tolist(), changes["NEW"].tolist()))
+    elif has_history and not moved.empty and parked_to > parked_from:
+        # the triggers logged old -> NULL when parking and NULL -> new after it;
+        # fold each pair back into the single old -> new entry
+        key = f"{schema['kind']}_id"
+        conn.execute(f"""
+            UPDATE {history} SET old_value = (
+                SELECT p.old_value FROM {history} p
+                WHERE p.rowid > ? AND p.rowid <= ? AND p.{key} = {history}.{key} AND p.changed_column = ?)
+            WHERE rowid > ? AND changed_column = ?
+        """, (parked_from, parked_to, unique.lower(), parked_to, unique.lower()))
+        conn.execute(f"""
+            DELETE FROM {history} WHERE rowid > ? AND rowid <= ? AND {key} IN (
+                SELECT {key} FROM {history} WHERE rowid > ? AND changed_column = ?)
+        """, (parked_from, parked_to, parked_to, unique.lower()))
+
+
+def diff_report(inserts, changes, unchanged):
+    """Compact dry-run report: counts, changed cells per column and a few sample cells."""
+    return {
+        "inserts": len(inserts),
+        "updates": int(changes["ID"].nunique()),
+        "unchanged": unchanged,
+        "changed_cells": len(changes),
+        "by_column": {c.lower(): int(n) for c, n in changes["COLUMN"].value_counts().items()},
+        "sample": [{"id": r.ID, "column": r.COLUMN.lower(), "old": r.OLD, "new": r.NEW}
+                   for r in changes.head(SAMPLE_CHANGES).itertuples()],
+    }
+
+
+def merge_report(total, part):
+    """Add a batch's diff_report into the running total (streaming mode)."""
+    for key in ("inserts", "updates", "unchanged", "changed_cells"):
+        total[key] = total.get(key, 0) + part[key]
+    by_column = total.setdefault("by_column", {})
+    for col, n in part["by_column"].items():
+        by_column[col] = by_column.get(col, 0) + n
+    total["sample"] = (total.get("sample", []) + part["sample"])[:SAMPLE_CHANGES]
+    return total
+
+
+def import_frame(schema, df, db_path, dry_run=False):
+    """
+    Import a sheet into the schema's table: diff it against the current rows
+    (diff_frame) and, unless dry_run, write the new rows and only the changed
+    cells plus their history in one transaction. The summary's "diff" is the
+    dry-run report. Raises ValueError for a sheet with missing columns.
+    """
+    t0 = time.perf_counter()
+    df, no_id = prepare_frame(schema, df)
+    total = len(df)
+    # the same ID twice in a sheet: the last row wins, as it did row by row
+    df = df.drop_duplicates("ID", keep="last")
+    duplicate_ids = total - len(df)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conflicts = []
+        if schema["unique"]:
+            bad = unique_conflicts(conn, schema, df, set(df["ID"]))
+            conflicts = sorted(df.loc[bad, schema["unique"]].unique().tolist())
+            skipped_unique, df = int(bad.sum()), df[~bad]
+        inserts, changes, unchanged = diff_frame(conn, schema, df)
+        if not dry_run:
+            with conn:
+                apply_diff(conn, schema, inserts, changes)
+    finally:
+        conn.close()
+
+    report = diff_report(inserts, changes, unchanged)
+    summary = {
+        "rows": total + no_id,
+        "updated": report["updates"],
+        "inserted": report["inserts"],
+        "unchanged": unchanged,
+        "skipped": no_id,
+        "skipped_no_id": no_id,
+        "duplicate_ids": duplicate_ids,
+        "dry_run": dry_run,
+        "diff": report,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+    if schema["unique"]:
+        summary["skipped"] += skipped_unique
+        summary[f"skipped_{schema['unique'].lower()}"] = conflicts
+    return summary
+
+
+def import_excel(schema, excel_path, db_path, dry_run=False):
+    """Read an Excel master sheet and import it into db_path. Returns the summary dict."""
+    return import_frame(schema, pd.read_excel(excel_path), db_path, dry_run)
+
+
+def iter_sheet_batches(path, batch_size=BATCH_SIZE, sheet=None):
+    """
+    Yield DataFrames of at most batch_size rows without loading the whole file:
+    openpyxl read-only rows for .xlsx/.xlsm, chunked read_csv for .csv. Old .xls
+    files can only be read whole and are then cut into batches. sheet picks a
+    worksheet by name (default the active one).
+    A sheet with a header but no rows yields one empty frame.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        yield from pd.read_csv(path, chunksize=batch_size, dtype=object)
+        return
+    if ext not in (".xlsx", ".xlsm"):
+        df = pd.read_excel(path, sheet_name=sheet or 0)
+        for start in range(0, max(len(df), 1), batch_size):
+            yield df.iloc[start:start + batch_size]
+        return
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = (wb[sheet] if sheet else wb.active).iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+        width, batch, sent = len(header), [], False
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            batch.append((tuple(row) + (None,) * width)[:width])
+            if len(batch) == batch_size:
+                yield pd.DataFrame(batch, columns=header)
+                batch, sent = [], True
+        if batch or not sent:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        wb.close()
+
+
+def print_progress(rows, seconds):
+    print(f"⏳ {rows} rows, {rows / seconds if seconds else 0:.0f} rows/s")
+
+
+def import_stream(schema, path, db_path, batch_size=BATCH_SIZE, progress=print_progress, dry_run=False):
+    """
+    Streaming import: read, clean and upsert batch_size rows at a time and commit
+    after each batch, so memory stays flat however long the sheet is. Each batch
+    is diffed like import_frame; with dry_run nothing is written.
+    progress(rows_done, seconds) is called after every batch. Returns the summary
+    dict; a ValueError (missing columns) is raised before anything is written.
+    """
+    t0 = time.perf_counter()
+    totals = {"rows": 0, "skipped": 0, "skipped_no_id": 0, "duplicate_ids": 0}
+    report, conflicts = {}, set()
+    conn = sqlite3.connect(db_path)
+    try:
+        for batch in iter_sheet_batches(path, batch_size):
+            df, no_id = prepare_frame(schema, batch)
+            totals["rows"] += len(batch)
+            write_prepared(conn, schema, df, no_id, totals, report, conflicts, dry_run)
+            if progress:
+                progress(totals["rows"], time.perf_counter() - t0)
+    finally:
+        conn.close()
+    return finish_totals(schema, totals, report, conflicts, dry_run, t0)
+
+
+def write_prepared(conn, schema, df, no_id, totals, report, conflicts, dry_run):
+    """
+    Writer step of the batch modes: drop repeated IDs (the last wins), skip
+    unique-field conflicts, then diff and, unless dry_run, commit. Adds the
+    counts to totals/report/conflicts and returns this part's diff_report.
+    """
+    totals["skipped_no_id"] += no_id
+    totals["skipped"] += no_id
+    n = len(df)
+    df = df.drop_duplicates("ID", keep="last")
+    totals["duplicate_ids"] += n - len(df)
+
+    if schema["unique"]:
+        # unique rules per part: no repeats, and none held by a row outside it
+        bad = unique_conflicts(conn, schema, df, set(df["ID"]))
+        conflicts.update(df.loc[bad, schema["unique"]])
+        totals["skipped"] += int(bad.sum())
+        df = df[~bad]
+
+    inserts, changes, unchanged = diff_frame(conn, schema, df)
+    if not dry_run:
+        with conn:
+            apply_diff(conn, schema, inserts, changes)
+    part = diff_report(inserts, changes, unchanged)
+    merge_report(report, part)
+    return part
+
+
+def finish_totals(schema, totals, report, conflicts, dry_run, t0):
+    if schema["unique"]:
+        totals[f"skipped_{schema['unique'].lower()}"] = sorted(conflicts)
+    totals.update(updated=report.get("updates", 0), inserted=report.get("inserts", 0),
+                  unchanged=report.get("unchanged", 0), dry_run=dry_run, diff=report)
+    seconds = time.perf_counter() - t0
+    totals["seconds"] = round(seconds, 3)
+    totals["rows_per_sec"] = round(totals["rows"] / seconds) if seconds else None
+    return totals
+
+
+def sheet_sources(path, all_sheets=True):
+    """
+    What a multi-source import reads, as (file, sheet) pairs: every sheet file in
+    a directory (sorted by name), and every sheet of each workbook when
+    all_sheets (sheet None = the active sheet / the whole CSV).
+    """
+    if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in sorted(os.listdir(path))
+                 if os.path.splitext(f)[1].lower() in SHEET_EXTENSIONS and not f.startswith("~$")]
+    else:
+        files = [path]
+    sources = []
+    for f in files:
+        ext = os.path.splitext(f)[1].lower()
+        names = [None]
+        if all_sheets and ext != ".csv":
+            try:
+                if ext in (".xlsx", ".xlsm"):
+                    wb = openpyxl.load_workbook(f, read_only=True)
+                    names = wb.sheetnames
+                    wb.close()
+                else:
+                    names = pd.ExcelFile(f).sheet_names
+            except Exception:
+                pass  # unreadable: read_source reports the error for this file
+        sources.extend((f, name) for name in names)
+    return sources
+
+
+def source_label(path, sheet):
+    return os.path.basename(path) + (f" [{sheet}]" if sheet else "")
+
+
+def read_source(schema, path, sheet):
+    """Pool worker: read and normalize one file/sheet. Returns (prepared frame, no_id, rows, seconds)."""
+    t0 = time.perf_counter()
+    sheet_df = pd.concat(list(iter_sheet_batches(path, BATCH_SIZE, sheet)), ignore_index=True)
+    df, no_id = prepare_frame(schema, sheet_df)
+    return df, no_id, len(sheet_df), time.perf_counter() - t0
+
+
+def print_file_progress(done, total, entry):
+    label = source_label(entry["file"], entry["sheet"])
+    if entry.get("error"):
+        print(f"❌ [{done}/{total}] {label}: {entry['error']}")
+    else:
+        print(f"📄 [{done}/{total}] {label}: {entry['rows']} rows, {entry['inserted']} new, "
+              f"{entry['updated']} updated (read {entry['parse_seconds']}s, write {entry['write_seconds']}s)")
+
+
+def import_many(schema, path, db_path, workers=None, all_sheets=True, progress=print_file_progress, dry_run=False):
+    """
+    Import a directory of sheet files and/or every sheet of a workbook. Files are
+    read and normalized in a process pool (workers, default one per core) while
+    this process is the only SQLite writer: each file is written and committed
+    in source order, so with repeated IDs the later file wins. A file that cannot
+    be read or lacks columns is reported in "files" with its error and skipped.
+    progress(done, total, file_entry) is called as each file is written.
+    """
+    t0 = time.perf_counter()
+    sources = sheet_sources(path, all_sheets)
+    totals = {"rows": 0, "skipped": 0, "skipped_no_id": 0, "duplicate_ids": 0, "failed": 0, "files": []}
+    report, conflicts = {}, set()
+    conn = sqlite3.connect(db_path)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(read_source, schema, f, sheet) for f, sheet in sources]
+            for n, ((f, sheet), future) in enumerate(zip(sources, futures), 1):
+                entry = {"file": f, "sheet": sheet}
+                try:
+                    df, no_id, rows, parse_s = future.result()
+                except Exception as e:  # unreadable file or a sheet with other columns: import the rest
+                    entry["error"] = str(e)
+                    totals["failed"] += 1
+                else:
+                    t1, skipped = time.perf_counter(), totals["skipped"]
+                    part = write_prepared(conn, schema, df, no_id, totals, report, conflicts, dry_run)
+                    totals["rows"] += rows
+                    entry.update(rows=rows, inserted=part["inserts"], updated=part["updates"],
+                                 unchanged=part["unchanged"], skipped=totals["skipped"] - skipped,
+                                 parse_seconds=round(parse_s, 3),
+                                 write_seconds=round(time.perf_counter() - t1, 3))
+                totals["files"].append(entry)
+                if progress:
+                    progress(n, len(sources), entry)
+    finally:
+        conn.close()
+    totals["workers"] = workers or os.cpu_count()
+    return finish_totals(schema, totals, report, conflicts, dry_run, t0)
+
+
+def format_summary(schema, summary):
+    text = f"✅ Updated: {summary['updated']}\n🆕 Inserted: {summary['inserted']}\n⚠️ Skipped: {summary['skipped']}"
+    in_use = summary.get(f"skipped_{schema['unique'].lower()}") if schema["unique"] else None
+    if in_use:
+        text += f"\n⚠️ {schema['unique'].replace('_', ' ').title()} already in use: {', '.join(in_use)}"
+    if summary.get("unchanged") is not None:
+        text += f"\n➖ Unchanged: {summary['unchanged']}"
+    if summary.get("files") is not None:
+        text += f"\n📄 Files: {len(summary['files'])} ({summary['failed']} failed, {summary['workers']} workers)"
+    by_column = summary.get("diff", {}).get("by_column")
+    if by_column:
+        text += "\n✏️ Changed cells: " + ", ".join(f"{c} {n}" for c, n in by_column.items())
+    if summary.get("dry_run"):
+        text = "🔍 Dry run, nothing written\n" + text
+    return text
+
+
+def import_dialog(schema):
+    """Desktop import: pick the sheet and the database, preview the diff, confirm, apply."""
+    # tkinter only for the desktop dialogs, so the command line runs on servers without Tk
+    from tkinter import Tk, filedialog, messagebox
+
+    # Choose Excel file
+    Tk().withdraw()
+    excel_path = filedialog.askopenfilename(
+        title="Select Excel File",
+        filetypes=[("Excel Files", "*.xlsx *.xls")]
+    )
+    if not excel_path:
+        messagebox.showwarning("No file selected", "Please select an Excel file.")
+        return
+
+    # Choose database
+    db_path = filedialog.askopenfilename(
+        title=f"Select {schema['kind']}.db File",
+        filetypes=[("SQLite Database", "*.db")]
+    )
+    if not db_path:
+        messagebox.showwarning("No DB selected", "Please select a database file.")
+        return
+
+    try:
+        # preview the diff first and only write once it is confirmed
+        preview = import_excel(schema, excel_path, db_path, dry_run=True)
+        if not messagebox.askyesno("Apply import?", format_summary(schema, preview) + "\n\nApply these changes?"):
+            return
+        summary = import_excel(schema, excel_path, db_path)
+    except ValueError as e:
+        messagebox.showerror("Column mismatch", str(e))
+        return
+    except sqlite3.Error as e:
+        messagebox.showerror("Import failed", f"Nothing was imported: {e}")
+        return
+
+    messagebox.showinfo("Import Complete", format_summary(schema, summary))
+    print("\n" + format_summary(schema, summary))
+
+
+def benchmark_import(schema, rows=20000):
+    """Time a synthetic master sheet: Excel read, then the diffed import (half updates, half inserts)."""
+    table, data_cols, unique = schema["table"], schema["data_cols"], schema["unique"]
+    workdir = tempfile.mkdtemp()
+    excel_path = os.path.join(workdir, "master.xlsx")
+    db_path = os.path.join(workdir, f"{schema['kind']}.db")
+
+    df = pd.DataFrame({c: [f"{c.lower()}-{i}" for i in range(rows)] for c in data_cols})
+    df.insert(0, "ID", range(1, rows + 1))
+    if unique:
+        df[unique] = [f"N{i:06}" for i in range(rows)]
+    if "DATE_RECEIVED" in df:
+        df["DATE_RECEIVED"] = pd.Timestamp("2025-01-01") + pd.to_timedelta(range(rows), unit="min")
+    t0 = time.perf_counter()
+    df.to_excel(excel_path, index=False)
+    print(f"📝 Wrote {rows} rows to {excel_path} in {time.perf_counter() - t0:.1f}s")
+
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"""
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            {', '.join(f'{c.lower()} TEXT' for c in data_cols)},
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    if unique:
+        conn.execute(f"CREATE UNIQUE INDEX ux_{table}_{unique.lower()} ON {table} ({unique.lower()})")
+        conn.executemany(f"INSERT INTO {table} (id, {unique.lower()}) VALUES (?, ?)",
+                         [(i, f"N{i - 1:06}") for i in range(1, rows // 2 + 1)])
+    else:
+        conn.executemany(f"INSERT INTO {table} (id) VALUES (?)", [(i,) for i in range(1, rows // 2 + 1)])
+    conn.commit()
+    conn.close()
+
+    t0 = time.perf_counter()
+    sheet = pd.read_excel(excel_path)
+    read_s = time.perf_counter() - t0
+    summary = import_frame(schema, sheet, db_path)
+    print(f"📖 Excel read: {read_s:.2f}s")
+    print(f"💾 Import: {summary['seconds']:.2f}s ({rows / summary['seconds']:.0f} rows/s)")
+    print(format_summary(schema, summary))
+    return summary
+
+
+def main(schema, argv=None):
+    """
+    Command line: `<App>appDB.py EXCEL DB [--json]` imports headless and
+    exits with EXIT_*; with no arguments the file dialogs open as before.
+    EXCEL may be a directory of sheet files (see import_many).
+    """
+    multiprocessing.freeze_support()  # the pool's workers in a PyInstaller build
+    kind = schema["kind"]
+    parser = argparse.ArgumentParser(description=f"Import a {kind} master Excel sheet into {kind}.db.")
+    parser.add_argument("excel", nargs="?",
+                        help="Excel file (.xlsx/.xls), .csv with --stream, or a directory of them")
+    parser.add_argument("db", nargs="?", help=f"{kind}.db to import into")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON on stdout")
+    parser.add_argument("--stream", action="store_true",
+                        help="import in batches with flat memory use (xlsx read-only / chunked csv)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="report inserts and changed cells without writing anything")
+    parser.add_argument("--all-sheets", action="store_true",
+                        help="import every sheet of the workbook(s), not just the active one")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes reading files in parallel for a directory or --all-sheets (default: one per core)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows per batch with --stream")
+    parser.add_argument("--benchmark", type=int, nargs="?", const=20000, metavar="ROWS",
+                        help="time the import of a synthetic sheet (default 20000 rows)")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        summary = benchmark_import(schema, args.benchmark)
+        if args.json:
+            print(json.dumps(summary))
+        return EXIT_OK
+    if not args.excel and not args.db:
+        import_dialog(schema)
+        return EXIT_OK
+    if not (args.excel and args.db):
+        parser.error("give both EXCEL and DB")
+
+    result = {"excel": args.excel, "db": args.db}
+    code = EXIT_OK
+    missing = [p for p, found in ((args.excel, os.path.exists(args.excel)), (args.db, os.path.isfile(args.db)))
+               if not found]
+    if missing:
+        code, result["error"] = EXIT_FILE_NOT_FOUND, f"File not found: {', '.join(missing)}"
+    else:
+        try:
+            if os.path.isdir(args.excel) or args.all_sheets:
+                progress = None if args.json else print_file_progress
+                result.update(import_many(schema, args.excel, args.db, args.workers, args.all_sheets,
+                                          progress, args.dry_run))
+                if result["failed"]:
+                    code, result["error"] = EXIT_BAD_SHEET, \
+                        f"{result['failed']} of {len(result['files'])} files/sheets could not be imported"
+            elif args.stream:
+                progress = None if args.json else print_progress
+                result.update(import_stream(schema, args.excel, args.db, args.batch_size, progress, args.dry_run))
+            else:
+                result.update(import_excel(schema, args.excel, args.db, args.dry_run))
+        except ValueError as e:
+            code, result["error"] = EXIT_BAD_SHEET, str(e)
+        except (sqlite3.Error, OSError) as e:
+            code, result["error"] = EXIT_IMPORT_FAILED, f"Nothing was imported: {e}"
+    result["ok"] = code == EXIT_OK
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        if "updated" in result:
+            print(format_summary(schema, result))
+        if code != EXIT_OK:
+            print(f"❌ {result['error']}", file=sys.stderr)
+    return code
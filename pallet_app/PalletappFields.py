@@ -0,0 +1,11 @@
+"""
+Pallet field lists, shared by app.py and the master sheet importer
+(PalletappDB.py). Kept free of imports so either can load it cheaply.
+"""
+SHORT_FIELDS = ["fg","customer","pallet_no","pallet_qty","rack_no","location"]
+ALL_FIELDS = SHORT_FIELDS + [
+    "pallet_supplier",
+    "supplier_prt_no","date_received","pallet_validation_dt","pallet_revalidation_dt",
+    "received_by",
+    "condition_status","production_status","emp_id","remarks"
+]
@@ -6,10 +6,16 @@ import time
 import datetime
 import shutil
 import threading
+import json
 import webbrowser
 from flask import Flask, render_template, request, jsonify, abort
 from werkzeug.security import generate_password_hash, check_password_hash
 
+try:
+    from .PalletappFields import SHORT_FIELDS, ALL_FIELDS   # as pallet_app.app (waitress from the repo root)
+except ImportError:
+    from PalletappFields import SHORT_FIELDS, ALL_FIELDS    # as a script / frozen exe
+
 def create_app():
     app = Flask(__name__, template_folder="templates", static_folder="static")
     app.secret_key = "supersecretkey"
@@ -33,6 +39,36 @@ def create_app():
         conn.row_factory = sqlite3.Row
         return conn
 
+    # ---------------- Date Fields ----------------
+    # Stored as YYYY-MM-DD so SQLite's date() (alert scan, due lists, sorting) can read
+    # them. Older rows and hand-typed values use these layouts; numeric ones are read
+    # day first. Anything else is kept as typed and never raises a revalidation alert.
+    DATE_FIELDS = ("date_received", "pallet_validation_dt", "pallet_revalidation_dt")
+    DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y",
+                    "%d/%m/%y", "%d-%m-%y", "%d-%b-%Y", "%d %b %Y", "%d-%b-%y", "%d %B %Y", "%b %d, %Y")
+
+    def iso_date(value):
+        """value as YYYY-MM-DD when it matches one of DATE_FORMATS, else unchanged."""
+        text = str(value or "").strip()
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+            except ValueError:
+                pass
+        return value
+
+    def normalize_stored_dates(cur):
+        """One-off migration: rewrite free-text dates already in pallet_list as ISO."""
+        for field in DATE_FIELDS:
+            rows = cur.execute(f"""
+                SELECT id, {field} FROM pallet_list
+                WHERE IFNULL({field}, '') != '' AND {field} NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+            """).fetchall()
+            fixed = [(iso_date(r[field]), r["id"]) for r in rows if iso_date(r[field]) != r[field]]
+            if fixed:
+                cur.executemany(f"UPDATE pallet_list SET {field}=? WHERE id=?", fixed)
+                print(f"📅 {len(fixed)} {field} values rewritten as YYYY-MM-DD ({len(rows) - len(fixed)} unreadable left as is)")
+
     def init_db():
         conn = get_db()
         cur = conn.cursor()
@@ -103,6 +139,24 @@ def create_app():
             );
         """)
 
+        # alerts raised by the revalidation scanner (one open alert per pallet)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                asset_id INTEGER,
+                asset_no TEXT,
+                status_class TEXT,
+                severity TEXT,
+                message TEXT,
+                raised_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                resolved_at TIMESTAMP
+            );
+        """)
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_alerts_open ON alerts (asset_id) WHERE resolved_at IS NULL")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_alerts_resolved ON alerts (resolved_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_pallet_list_reval ON pallet_list (pallet_revalidation_dt)")
+        normalize_stored_dates(cur)
+
         # Preload default users if table empty
         existing = cur.execute("SELECT COUNT(*) as c FROM users").fetchone()["c"]
         if existing == 0:
@@ -124,16 +178,138 @@ def create_app():
         conn.close()
         print(f"✅ Database initialized at {LOCAL_DB}")
 
+    # ==============================================================
+    # 🔔 Revalidation Alerts
+    # ==============================================================
+    # Thresholds per asset type; override any of them in status_rules.json next to
+    # the database, e.g. {"pallet": {"revalidation_notice_days": 14}}. Read at startup.
+    ASSET_TYPE = "pallet"
+    STATUS_THRESHOLDS = {
+        "pallet": {
+            "revalidation_end_days": 1,       # ≤ 1 day   → case3
+            "revalidation_soon_days": 5,      # ≤ 5 days  → case2
+            "revalidation_notice_days": 10,   # ≤ 10 days → case1
+        },
+    }
+    STATUS_LABELS = {
+        "case3": "REVALIDATION TIME END",
+        "case2": "RE-VALIDATION NEED TO DONE SOON",
+        "case1": "RE-VALIDATION NEED TO DONE SOON",
+    }
+    ALERT_SEVERITY = {"case3": "critical", "case2": "warning", "case1": "info"}
+    ALERT_SCAN_INTERVAL = 60 * 60  # 1 hour
+    RULES_FILE = os.path.join(BASE_DIR, "status_rules.json")
+
+    def load_status_thresholds():
+        rules = dict(STATUS_THRESHOLDS[ASSET_TYPE])
+        if os.path.exists(RULES_FILE):
+            try:
+                with open(RULES_FILE, encoding="utf-8") as f:
+                    overrides = json.load(f).get(ASSET_TYPE, {})
+                rules.update({k: float(v) for k, v in overrides.items() if k in rules})
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                print(f"⚠️ Ignoring {RULES_FILE}: {e}")
+        return rules
+
+    status_rules = load_status_thresholds()
+
+    def sync_alerts(conn):
+        """
+        Bring the open alerts in line with the revalidation dates. Only pallets inside
+        the notice window (an index range on pallet_revalidation_dt) and the open alerts
+        are read; only alerts that were raised or cleared are written. Returns (raised, resolved).
+        """
+        days = "(julianday(date(p.pallet_revalidation_dt)) - julianday(date('now', 'localtime')))"
+        cls = (f"CASE WHEN {days} <= {float(status_rules['revalidation_end_days'])} THEN 'case3' "
+               f"WHEN {days} <= {float(status_rules['revalidation_soon_days'])} THEN 'case2' "
+               f"WHEN {days} <= {float(status_rules['revalidation_notice_days'])} THEN 'case1' END")
+        window = f"+{int(status_rules['revalidation_notice_days']) + 1} days"
+        due = f"""
+            SELECT p.id, p.pallet_no, {cls} AS cls FROM pallet_list p
+            WHERE p.pallet_revalidation_dt <= date('now', 'localtime', ?) AND p.condition_status != 'SCRAP'
+        """
+        label = "CASE d.cls " + " ".join(f"WHEN '{k}' THEN '{v}'" for k, v in STATUS_LABELS.items()) + " END"
+        severity = "CASE d.cls " + " ".join(f"WHEN '{k}' THEN '{v}'" for k, v in ALERT_SEVERITY.items()) + " END"
+
+        resolved = conn.execute(f"""
+            UPDATE alerts SET resolved_at = CURRENT_TIMESTAMP
+            WHERE resolved_at IS NULL AND NOT EXISTS (
+                SELECT 1 FROM ({due}) d WHERE d.id = alerts.asset_id AND d.cls = alerts.status_class
+            )
+        """, (window,)).rowcount
+        raised = conn.execute(f"""
+            INSERT OR IGNORE INTO alerts (asset_id, asset_no, status_class, severity, message)
+            SELECT d.id, d.pallet_no, d.cls, {severity}, {label}
+            FROM ({due}) d
+            WHERE d.cls IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM alerts a WHERE a.asset_id = d.id AND a.resolved_at IS NULL)
+        """, (window,)).rowcount
+        return raised, resolved
+
+    def alert_scanner_job():
+        """Background job: hourly incremental alert sync."""
+        while True:
+            try:
+                conn = get_db()
+                raised, resolved = sync_alerts(conn)
+                conn.commit()
+                conn.close()
+                if raised or resolved:
+                    print(f"🔔 Alerts: {raised} raised, {resolved} resolved")
+            except sqlite3.Error as e:
+                print(f"❌ Alert scan failed: {e}")
+            time.sleep(ALERT_SCAN_INTERVAL)
+
+    def start_alert_thread():
+        t = threading.Thread(target=alert_scanner_job, daemon=True)
+        t.start()
+        print("🔔 Alert scanner thread started")
+
     # ==============================================================
     # 💾 Backup System (Weekly)
     # ==============================================================
+    BACKUP_PAGES_PER_STEP = 256  # pages copied per step; writers can get in between steps
+    BACKUP_STEP_SLEEP = 0.05     # seconds
+
     def backup_db():
-        """Create timestamped .bak copy of the database."""
-        if os.path.exists(LOCAL_DB):
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_name = os.path.join(BACKUP_DIR, f"stencil_{timestamp}.bak")
-            shutil.copy2(LOCAL_DB, backup_name)
-            print(f"🗄 Backup created at {backup_name}")
+        """
+        Create timestamped .bak copy of the database with the SQLite online backup
+        API (never a torn copy of a live file), then integrity_check the copy.
+        Returns a stats dict, or None when there is no database or the copy is bad.
+        """
+        if not os.path.exists(LOCAL_DB):
+            return None
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_name = os.path.join(BACKUP_DIR, f"stencil_{timestamp}.bak")
+        pages = [0]
+
+        def progress(status, remaining, total):
+            pages[0] = total
+
+        t0 = time.perf_counter()
+        src = sqlite3.connect(LOCAL_DB)
+        dst = sqlite3.connect(backup_name)
+        try:
+            src.backup(dst, pages=BACKUP_PAGES_PER_STEP, progress=progress, sleep=BACKUP_STEP_SLEEP)
+            integrity = dst.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            dst.close()
+            src.close()
+        seconds = time.perf_counter() - t0
+
+        if integrity != "ok":
+            os.replace(backup_name, backup_name + ".corrupt")
+            print(f"❌ Backup failed integrity check ({integrity}), kept as {backup_name}.corrupt")
+            return None
+        stats = {
+            "path": backup_name,
+            "pages": pages[0],
+            "seconds": round(seconds, 3),
+            "pages_per_sec": round(pages[0] / seconds) if seconds else None,
+        }
+        print(f"🗄 Backup created at {backup_name} "
+              f"({stats['pages']} pages in {stats['seconds']}s, {stats['pages_per_sec']} pages/s, integrity ok)")
+        return stats
 
     def weekly_backup_job():
         """Background job that runs every week."""
@@ -150,6 +326,7 @@ def create_app():
     os.makedirs(BASE_DIR, exist_ok=True)
     init_db()
     start_backup_thread()
+    start_alert_thread()
 
     # ==============================================================
     # ⚙️ Existing App Logic
@@ -158,20 +335,20 @@ def create_app():
     app.get_db = get_db
 
     # ---------------- Utilities ----------------
-    SHORT_FIELDS = ["fg","customer","pallet_no","pallet_qty","rack_no","location"]
-    ALL_FIELDS = SHORT_FIELDS + [
-        "pallet_supplier",
-        "supplier_prt_no","date_received","pallet_validation_dt","pallet_revalidation_dt",
-        "received_by",
-        "condition_status","production_status","emp_id","remarks"
-    ]
-
     def to_upper(d: dict):
         out = {}
         for k, v in d.items():
             out[k] = "" if v is None else str(v).strip().upper()
         return out
 
+    def clean_fields(d: dict):
+        """to_upper plus the date fields as YYYY-MM-DD: what every write stores."""
+        out = to_upper(d)
+        for k in DATE_FIELDS:
+            if out.get(k):
+                out[k] = iso_date(out[k])
+        return out
+
     def row_to_dict(row, fields=None):
         if row is None:
             return None
@@ -354,6 +531,35 @@ def create_app():
         conn.close()
         return jsonify([row_to_dict(r) for r in rows])
 
+    @app.route("/api/alerts")
+    def api_alerts():
+        """Alerts with counts per severity. ?state=open|resolved|all (default open), ?severity=..., ?limit=0 for counts only."""
+        state = request.args.get("state", "open")
+        severity = request.args.get("severity")
+        limit = max(0, min(request.args.get("limit", 1000, type=int), 1000))
+        where, params = [], []
+        if state == "open":
+            where.append("resolved_at IS NULL")
+        elif state == "resolved":
+            where.append("resolved_at IS NOT NULL")
+        if severity:
+            where.append("severity = ?")
+            params.append(severity.lower())
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+        conn = get_db()
+        counts = {sev: 0 for sev in ("critical", "warning", "info")}
+        for r in conn.execute("SELECT severity, COUNT(*) AS c FROM alerts WHERE resolved_at IS NULL GROUP BY severity"):
+            counts[r["severity"]] = r["c"]
+        rows = conn.execute(f"""
+            SELECT id, asset_id, asset_no, status_class, severity, message, raised_at, resolved_at
+            FROM alerts {where_sql}
+            ORDER BY raised_at DESC, id DESC
+            LIMIT ?
+        """, params + [limit]).fetchall()
+        conn.close()
+        return jsonify({"ok": True, "counts": counts, "alerts": [dict(r) for r in rows]})
+
     # ------- ISOS APIs -------
     @app.route("/api/isos_list")
     def api_isos_list():
@@ -513,7 +719,7 @@ def create_app():
         if not ok:
             return jsonify({"ok": False, "error": "Unauthorized"}), 403
 
-        data = to_upper({k: payload.get(k) for k in ALL_FIELDS})
+        data = clean_fields({k: payload.get(k) for k in ALL_FIELDS})
         data["emp_id"] = emp_id
         conn = get_db()
         cur = conn.cursor()
@@ -540,7 +746,7 @@ def create_app():
             conn.close()
             abort(404)
 
-        new_data = to_upper({k: payload.get(k) for k in ALL_FIELDS})
+        new_data = clean_fields({k: payload.get(k) for k in ALL_FIELDS})
         new_data["emp_id"] = emp_id
         changes = []
         for f in ALL_FIELDS:
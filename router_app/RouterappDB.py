@@ -0,0 +1,51 @@
+"""
+Router master sheet import: the router schema for the shared AssetImportDB
+importer. From the repo root, run python -m router_app.RouterappDB with no arguments
+for the file dialogs, or see --help.
+"""
+import sys
+
+import AssetImportDB
+
+try:
+    from .RouterappFields import ALL_FIELDS   # python -m router_app.RouterappDB
+except ImportError:
+    from RouterappFields import ALL_FIELDS    # frozen exe / router_app folder on sys.path
+
+# Sheet columns are "ID" plus these upper-cased
+SCHEMA = AssetImportDB.make_schema("router", ALL_FIELDS)
+EXPECTED_COLS = SCHEMA["columns"]
+DATA_COLS = SCHEMA["data_cols"]
+BATCH_SIZE = AssetImportDB.BATCH_SIZE
+
+
+def import_router_frame(df, db_path, dry_run=False):
+    return AssetImportDB.import_frame(SCHEMA, df, db_path, dry_run)
+
+
+def import_router_excel(excel_path, db_path, dry_run=False):
+    return AssetImportDB.import_excel(SCHEMA, excel_path, db_path, dry_run)
+
+
+def import_router_stream(path, db_path, batch_size=BATCH_SIZE, progress=AssetImportDB.print_progress, dry_run=False):
+    return AssetImportDB.import_stream(SCHEMA, path, db_path, batch_size, progress, dry_run)
+
+
+def format_summary(summary):
+    return AssetImportDB.format_summary(SCHEMA, summary)
+
+
+def import_excel_to_router_db():
+    AssetImportDB.import_dialog(SCHEMA)
+
+
+def benchmark_import(rows=20000):
+    return AssetImportDB.benchmark_import(SCHEMA, rows)
+
+
+def main(argv=None):
+    return AssetImportDB.main(SCHEMA, argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+"""
+Router field lists, shared by app.py and the master sheet importer
+(RouterappDB.py). Kept free of imports so either can load it cheaply.
+"""
+SHORT_FIELDS = ["fg","customer","router_no","rack_no","location"]
+ALL_FIELDS = SHORT_FIELDS + [
+    "router_supplier",
+    "router_pr_no","date_received","router_validation_dt","router_revalidation_dt",
+    "received_by",
+    "condition_status","production_status","emp_id","remarks"
+]
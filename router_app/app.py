@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
 import os
 import sqlite3
+import time
+import datetime
+import json
 import threading
 import webbrowser
 from flask import Flask, render_template, request, jsonify, abort
 from werkzeug.security import generate_password_hash, check_password_hash
 
+try:
+    from .RouterappFields import SHORT_FIELDS, ALL_FIELDS   # as router_app.app (waitress from the repo root)
+except ImportError:
+    from RouterappFields import SHORT_FIELDS, ALL_FIELDS    # as a script / frozen exe
+
 def create_app():
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_mapping(
@@ -21,6 +29,36 @@ def create_app():
         conn.row_factory = sqlite3.Row
         return conn
 
+    # ---------------- Date Fields ----------------
+    # Stored as YYYY-MM-DD so SQLite's date() (alert scan, due lists, sorting) can read
+    # them. Older rows and hand-typed values use these layouts; numeric ones are read
+    # day first. Anything else is kept as typed and never raises a revalidation alert.
+    DATE_FIELDS = ("date_received", "router_validation_dt", "router_revalidation_dt")
+    DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y",
+                    "%d/%m/%y", "%d-%m-%y", "%d-%b-%Y", "%d %b %Y", "%d-%b-%y", "%d %B %Y", "%b %d, %Y")
+
+    def iso_date(value):
+        """value as YYYY-MM-DD when it matches one of DATE_FORMATS, else unchanged."""
+        text = str(value or "").strip()
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+            except ValueError:
+                pass
+        return value
+
+    def normalize_stored_dates(cur):
+        """One-off migration: rewrite free-text dates already in router_list as ISO."""
+        for field in DATE_FIELDS:
+            rows = cur.execute(f"""
+                SELECT id, {field} FROM router_list
+                WHERE IFNULL({field}, '') != '' AND {field} NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+            """).fetchall()
+            fixed = [(iso_date(r[field]), r["id"]) for r in rows if iso_date(r[field]) != r[field]]
+            if fixed:
+                cur.executemany(f"UPDATE router_list SET {field}=? WHERE id=?", fixed)
+                print(f"📅 {len(fixed)} {field} values rewritten as YYYY-MM-DD ({len(rows) - len(fixed)} unreadable left as is)")
+
     def init_db():
         conn = get_db()
         cur = conn.cursor()
@@ -91,6 +129,24 @@ def create_app():
             );
         """)
 
+        # alerts raised by the revalidation scanner (one open alert per router)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                asset_id INTEGER,
+                asset_no TEXT,
+                status_class TEXT,
+                severity TEXT,
+                message TEXT,
+                raised_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                resolved_at TIMESTAMP
+            );
+        """)
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_alerts_open ON alerts (asset_id) WHERE resolved_at IS NULL")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_alerts_resolved ON alerts (resolved_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_router_list_reval ON router_list (router_revalidation_dt)")
+        normalize_stored_dates(cur)
+
         # Preload default users if table empty
         existing = cur.execute("SELECT COUNT(*) as c FROM users").fetchone()["c"]
         if existing == 0:
@@ -111,24 +167,112 @@ def create_app():
         conn.commit()
         conn.close()
 
+    # ==============================================================
+    # 🔔 Revalidation Alerts
+    # ==============================================================
+    # Thresholds per asset type; override any of them in status_rules.json next to
+    # the database, e.g. {"router": {"revalidation_notice_days": 14}}. Read at startup.
+    ASSET_TYPE = "router"
+    STATUS_THRESHOLDS = {
+        "router": {
+            "revalidation_end_days": 1,       # ≤ 1 day   → case3
+            "revalidation_soon_days": 5,      # ≤ 5 days  → case2
+            "revalidation_notice_days": 10,   # ≤ 10 days → case1
+        },
+    }
+    STATUS_LABELS = {
+        "case3": "REVALIDATION TIME END",
+        "case2": "RE-VALIDATION NEED TO DONE SOON",
+        "case1": "RE-VALIDATION NEED TO DONE SOON",
+    }
+    ALERT_SEVERITY = {"case3": "critical", "case2": "warning", "case1": "info"}
+    ALERT_SCAN_INTERVAL = 60 * 60  # 1 hour
+    RULES_FILE = os.path.join(app.instance_path, "status_rules.json")
+
+    def load_status_thresholds():
+        rules = dict(STATUS_THRESHOLDS[ASSET_TYPE])
+        if os.path.exists(RULES_FILE):
+            try:
+                with open(RULES_FILE, encoding="utf-8") as f:
+                    overrides = json.load(f).get(ASSET_TYPE, {})
+                rules.update({k: float(v) for k, v in overrides.items() if k in rules})
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                print(f"⚠️ Ignoring {RULES_FILE}: {e}")
+        return rules
+
+    status_rules = load_status_thresholds()
+
+    def sync_alerts(conn):
+        """
+        Bring the open alerts in line with the revalidation dates. Only routers inside
+        the notice window (an index range on router_revalidation_dt) and the open alerts
+        are read; only alerts that were raised or cleared are written. Returns (raised, resolved).
+        """
+        days = "(julianday(date(p.router_revalidation_dt)) - julianday(date('now', 'localtime')))"
+        cls = (f"CASE WHEN {days} <= {float(status_rules['revalidation_end_days'])} THEN 'case3' "
+               f"WHEN {days} <= {float(status_rules['revalidation_soon_days'])} THEN 'case2' "
+               f"WHEN {days} <= {float(status_rules['revalidation_notice_days'])} THEN 'case1' END")
+        window = f"+{int(status_rules['revalidation_notice_days']) + 1} days"
+        due = f"""
+            SELECT p.id, p.router_no, {cls} AS cls FROM router_list p
+            WHERE p.router_revalidation_dt <= date('now', 'localtime', ?) AND p.condition_status != 'SCRAP'
+        """
+        label = "CASE d.cls " + " ".join(f"WHEN '{k}' THEN '{v}'" for k, v in STATUS_LABELS.items()) + " END"
+        severity = "CASE d.cls " + " ".join(f"WHEN '{k}' THEN '{v}'" for k, v in ALERT_SEVERITY.items()) + " END"
+
+        resolved = conn.execute(f"""
+            UPDATE alerts SET resolved_at = CURRENT_TIMESTAMP
+            WHERE resolved_at IS NULL AND NOT EXISTS (
+                SELECT 1 FROM ({due}) d WHERE d.id = alerts.asset_id AND d.cls = alerts.status_class
+            )
+        """, (window,)).rowcount
+        raised = conn.execute(f"""
+            INSERT OR IGNORE INTO alerts (asset_id, asset_no, status_class, severity, message)
+            SELECT d.id, d.router_no, d.cls, {severity}, {label}
+            FROM ({due}) d
+            WHERE d.cls IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM alerts a WHERE a.asset_id = d.id AND a.resolved_at IS NULL)
+        """, (window,)).rowcount
+        return raised, resolved
+
+    def alert_scanner_job():
+        """Background job: hourly incremental alert sync."""
+        while True:
+            try:
+                conn = get_db()
+                raised, resolved = sync_alerts(conn)
+                conn.commit()
+                conn.close()
+                if raised or resolved:
+                    print(f"🔔 Alerts: {raised} raised, {resolved} resolved")
+            except sqlite3.Error as e:
+                print(f"❌ Alert scan failed: {e}")
+            time.sleep(ALERT_SCAN_INTERVAL)
+
+    def start_alert_thread():
+        t = threading.Thread(target=alert_scanner_job, daemon=True)
+        t.start()
+        print("🔔 Alert scanner thread started")
+
     with app.app_context():
         init_db()
+    start_alert_thread()
 
     # ---------------- Utilities ----------------
-    SHORT_FIELDS = ["fg","customer","router_no","rack_no","location"]
-    ALL_FIELDS = SHORT_FIELDS + [
-        "router_supplier",
-        "router_pr_no","date_received","router_validation_dt","router_revalidation_dt",
-        "received_by",
-        "condition_status","production_status","emp_id","remarks"
-    ]
-
     def to_upper(d: dict):
         out = {}
         for k, v in d.items():
             out[k] = "" if v is None else str(v).strip().upper()
         return out
 
+    def clean_fields(d: dict):
+        """to_upper plus the date fields as YYYY-MM-DD: what every write stores."""
+        out = to_upper(d)
+        for k in DATE_FIELDS:
+            if out.get(k):
+                out[k] = iso_date(out[k])
+        return out
+
     def row_to_dict(row, fields=None):
         if row is None:
             return None
@@ -311,6 +455,35 @@ def create_app():
         conn.close()
         return jsonify([row_to_dict(r) for r in rows])
 
+    @app.route("/api/alerts")
+    def api_alerts():
+        """Alerts with counts per severity. ?state=open|resolved|all (default open), ?severity=..., ?limit=0 for counts only."""
+        state = request.args.get("state", "open")
+        severity = request.args.get("severity")
+        limit = max(0, min(request.args.get("limit", 1000, type=int), 1000))
+        where, params = [], []
+        if state == "open":
+            where.append("resolved_at IS NULL")
+        elif state == "resolved":
+            where.append("resolved_at IS NOT NULL")
+        if severity:
+            where.append("severity = ?")
+            params.append(severity.lower())
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+        conn = get_db()
+        counts = {sev: 0 for sev in ("critical", "warning", "info")}
+        for r in conn.execute("SELECT severity, COUNT(*) AS c FROM alerts WHERE resolved_at IS NULL GROUP BY severity"):
+            counts[r["severity"]] = r["c"]
+        rows = conn.execute(f"""
+            SELECT id, asset_id, asset_no, status_class, severity, message, raised_at, resolved_at
+            FROM alerts {where_sql}
+            ORDER BY raised_at DESC, id DESC
+            LIMIT ?
+        """, params + [limit]).fetchall()
+        conn.close()
+        return jsonify({"ok": True, "counts": counts, "alerts": [dict(r) for r in rows]})
+
     # ------- ISOS APIs -------
     @app.route("/api/isos_list")
     def api_isos_list():
@@ -470,7 +643,7 @@ def create_app():
         if not ok:
             return jsonify({"ok": False, "error": "Unauthorized"}), 403
 
-        data = to_upper({k: payload.get(k) for k in ALL_FIELDS})
+        data = clean_fields({k: payload.get(k) for k in ALL_FIELDS})
         data["emp_id"] = emp_id
         conn = get_db()
         cur = conn.cursor()
@@ -497,7 +670,7 @@ def create_app():
             conn.close()
             abort(404)
 
-        new_data = to_upper({k: payload.get(k) for k in ALL_FIELDS})
+        new_data = clean_fields({k: payload.get(k) for k in ALL_FIELDS})
         new_data["emp_id"] = emp_id
         changes = []
         for f in ALL_FIELDS:
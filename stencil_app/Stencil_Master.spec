@@ -1,12 +1,16 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
+# The shared importer (AssetImportDB.py) lives in the repo root, one level up
+# from this spec; app.py imports it only when an import job runs.
+REPO_ROOT = os.path.abspath(os.path.join(SPECPATH, '..'))
 
 a = Analysis(
     ['app.py'],
-    pathex=[],
+    pathex=[REPO_ROOT],
     binaries=[],
     datas=[('static', 'static'), ('templates', 'templates')],
-    hiddenimports=['flask', 'flask_sqlalchemy'],
+    hiddenimports=['flask', 'flask_sqlalchemy', 'AssetImportDB', 'StencilappFields'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,12 @@
+"""
+Stencil field lists, shared by app.py and the master sheet importer
+(StencilappDB.py). Kept free of imports so either can load it cheaply.
+"""
+SHORT_FIELDS = ["fg","side","customer","stencil_no","rack_no","location"]
+ALL_FIELDS = SHORT_FIELDS + [
+    "stencil_mils","stencil_mils_usl","stencil_mils_lsl","stencil_supplier",
+    "stencil_pr_no","date_received","stencil_validation_dt","stencil_revalidation_dt",
+    "tension_a","tension_b","tension_c","tension_d","tension_e","received_by",
+    "condition_status","production_status","emp_id","remarks"
+]
+TENSION_FIELDS = ["tension_a","tension_b","tension_c","tension_d","tension_e"]
@@ -7,11 +7,31 @@ import datetime
 import shutil
 import threading
 import webbrowser
-from flask import Flask, render_template, request, jsonify, abort
+import functools
+import contextlib
+import json
+import hmac
+import secrets
+import gzip
+import hashlib
+import tempfile
+from flask import Flask, render_template, request, jsonify, abort, make_response, send_file
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 from werkzeug.security import generate_password_hash, check_password_hash
 
+try:
+    from .StencilappFields import SHORT_FIELDS, ALL_FIELDS, TENSION_FIELDS   # as stencil_app.app (waitress from the repo root)
+except ImportError:
+    from StencilappFields import SHORT_FIELDS, ALL_FIELDS, TENSION_FIELDS    # as a script / frozen exe
+
 
 def create_app():
+    # ⏱ startup phase timer: mark_phase(name) closes the phase that started at the previous mark
+    phase_marks = [("start", time.perf_counter())]
+
+    def mark_phase(name):
+        phase_marks.append((name, time.perf_counter()))
+
     app = Flask(__name__, template_folder="templates", static_folder="static")
     app.secret_key = "supersecretkey"
 
@@ -25,6 +45,7 @@ def create_app():
 
     os.makedirs(BASE_DIR, exist_ok=True)
     os.makedirs(BACKUP_DIR, exist_ok=True)
+    mark_phase("flask + paths")
 
     # ==============================================================
     # 🗄 Database Helper Functions
@@ -34,6 +55,19 @@ def create_app():
         conn.row_factory = sqlite3.Row
         return conn
 
+    def add_column_if_missing(cur, table, column, decl):
+        cols = [r[1] for r in cur.execute(f"PRAGMA table_info({table})").fetchall()]
+        if column not in cols:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    # Default accounts: username -> (initial password, emp_id). Hashing 21 passwords
+    # with PBKDF2 made a fresh install's first start slow, so each one is hashed on
+    # its first successful login instead.
+    DEFAULT_USERS = {"Admin": ("adminSRBG", "ADMIN")}
+    DEFAULT_USERS.update({f"User{i}": (f"User{i}", f"EMP{i:03}") for i in range(1, 21)})
+    # accounts seeded with users.is_admin = 1; the flag is only ever set here, never through an API
+    DEFAULT_ADMINS = {"Admin"}
+
     def init_db():
         conn = get_db()
         cur = conn.cursor()
@@ -105,14 +139,113 @@ def create_app():
             );
         """)
 
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS request_log (
+                request_id TEXT,
+                endpoint TEXT,
+                status_code INTEGER,
+                response TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (request_id, endpoint)
+            );
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_request_log_created ON request_log (created_at)")
+
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS login_throttle (
+                bucket TEXT PRIMARY KEY,
+                tokens REAL,
+                updated REAL
+            );
+        """)
+
+        # ---------------- Unique Stencil No ----------------
+        # once the index exists only rows still in a legacy spelling ('c3', 'C3 ')
+        # need the merge; the index is rebuilt after them
+        has_unique = cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='index' AND name='ux_stencil_list_stencil_no'").fetchone()
+        legacy = cur.execute(
+            "SELECT 1 FROM stencil_list WHERE stencil_no != UPPER(TRIM(stencil_no)) OR TRIM(stencil_no) = '' LIMIT 1"
+        ).fetchone()
+        if not has_unique or legacy:
+            cur.execute("DROP INDEX IF EXISTS ux_stencil_list_stencil_no")
+            merge_duplicate_stencils(conn)
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_stencil_list_stencil_no
+            ON stencil_list (stencil_no)
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_isos_cycles_stencil_open
+            ON isos_cycles (stencil_no, cycle_open)
+        """)
+
+        # bumped on every edit; PATCH callers send it back for optimistic concurrency
+        add_column_if_missing(cur, "stencil_list", "row_version", "INTEGER NOT NULL DEFAULT 1")
+
+        # ---------------- Derived Status ----------------
+        add_column_if_missing(cur, "stencil_list", "status_class", "TEXT")
+        add_column_if_missing(cur, "stencil_list", "derived_status", "TEXT")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_stencil_list_derived ON stencil_list (derived_status)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_stencil_list_reval ON stencil_list (stencil_revalidation_dt)")
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_stencil_list_flagged ON stencil_list (status_class)
+            WHERE status_class IS NOT NULL
+        """)
+        normalize_stored_dates(cur)
+        install_status_triggers(cur)
+        refresh_derived_status(conn)
+        install_history_triggers(cur)
+
+        # ---------------- Alerts ----------------
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                asset_id INTEGER,
+                asset_no TEXT,
+                status_class TEXT,
+                severity TEXT,
+                message TEXT,
+                raised_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                resolved_at TIMESTAMP
+            );
+        """)
+        # at most one open alert per stencil
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_alerts_open ON alerts (asset_id) WHERE resolved_at IS NULL")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_alerts_resolved ON alerts (resolved_at)")
+
+        # ---------------- History Snapshots ----------------
+        # history_id = last stencil_history.id already reflected in the snapshot
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS stencil_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                taken_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                history_id INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS stencil_snapshot_rows (
+                snapshot_id INTEGER NOT NULL,
+                stencil_id INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (snapshot_id, stencil_id)
+            ) WITHOUT ROWID;
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_stencil_snapshots_taken ON stencil_snapshots (taken_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_stencil_history_stencil_changed ON stencil_history (stencil_id, changed_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_stencil_history_changed ON stencil_history (changed_at)")
+
         # ---------------- Preload Default Users ----------------
+        # password_hash stays NULL until the first login (see check_password)
+        add_column_if_missing(cur, "users", "is_admin", "INTEGER NOT NULL DEFAULT 0")
+        # bumped on every credential change; session tokens signed with an older value stop working
+        add_column_if_missing(cur, "users", "token_version", "INTEGER NOT NULL DEFAULT 0")
         existing = cur.execute("SELECT COUNT(*) as c FROM users").fetchone()["c"]
         if existing == 0:
-            users = [("Admin", "adminSRBG", "ADMIN")]
-            users += [(f"User{i}", f"User{i}", f"EMP{i:03}") for i in range(1, 21)]
-            for u, p, emp in users:
-                cur.execute("INSERT INTO users (username, password_hash, emp_id) VALUES (?,?,?)",
-                            (u, generate_password_hash(p), emp))
+            cur.executemany("INSERT INTO users (username, password_hash, emp_id, is_admin) VALUES (?,NULL,?,?)",
+                            [(u, emp, int(u in DEFAULT_ADMINS)) for u, (_, emp) in DEFAULT_USERS.items()])
+        elif not cur.execute("SELECT 1 FROM users WHERE is_admin=1").fetchone():
+            # databases from before the is_admin column: the seeded admin account keeps its rights
+            cur.executemany("UPDATE users SET is_admin=1 WHERE username=?", [(u,) for u in DEFAULT_ADMINS])
 
         existing_ops = cur.execute("SELECT COUNT(*) as c FROM operators").fetchone()["c"]
         if existing_ops == 0:
@@ -124,32 +257,923 @@ def create_app():
         conn.close()
         print(f"✅ Database initialized at {LOCAL_DB}")
 
+    # ==============================================================
+    # 🔁 Duplicate Stencil No Resolution
+    # ==============================================================
+    def merge_duplicate_stencils(conn):
+        """
+        Fold every duplicate stencil_no (compared as UPPER(TRIM())) into its most
+        recently updated row.
+        Field values of the dropped rows and the merge itself are written to
+        stencil_history, their history is re-pointed at the kept row and only
+        the newest open ISOS cycle per stencil stays open. Returns merged row count.
+        """
+        cur = conn.cursor()
+        # blank stencil numbers are "not set", not one shared stencil
+        cur.execute("UPDATE stencil_list SET stencil_no=NULL WHERE TRIM(stencil_no)=''")
+        # every write path stores upper().strip(); bring legacy spellings in line
+        # first so 'c3' / 'C3 ' merge with 'C3' (their cycles follow them)
+        for table in ("stencil_list", "isos_cycles"):
+            cur.execute(f"UPDATE {table} SET stencil_no=UPPER(TRIM(stencil_no)) WHERE stencil_no != UPPER(TRIM(stencil_no))")
+
+        cur.execute("DROP TABLE IF EXISTS temp.stencil_dupes")
+        cur.execute("""
+            CREATE TEMP TABLE stencil_dupes AS
+            SELECT dup_id, keep_id FROM (
+                SELECT id AS dup_id,
+                       FIRST_VALUE(id) OVER w AS keep_id,
+                       ROW_NUMBER() OVER w AS rn
+                FROM stencil_list
+                WHERE stencil_no IS NOT NULL
+                WINDOW w AS (PARTITION BY stencil_no ORDER BY updated_at DESC, id DESC)
+            )
+            WHERE rn > 1
+        """)
+        merged = cur.execute("SELECT COUNT(*) AS c FROM stencil_dupes").fetchone()[0]
+
+        if merged:
+            cur.execute("""
+                UPDATE stencil_history
+                SET stencil_id = (SELECT keep_id FROM stencil_dupes WHERE dup_id = stencil_history.stencil_id)
+                WHERE stencil_id IN (SELECT dup_id FROM stencil_dupes)
+            """)
+            # keep the values of the dropped rows where they differ from the kept row
+            diff_selects = " UNION ALL ".join(f"""
+                SELECT d.keep_id, '{f}', dup.{f}, keep.{f}
+                FROM stencil_dupes d
+                JOIN stencil_list dup ON dup.id = d.dup_id
+                JOIN stencil_list keep ON keep.id = d.keep_id
+                WHERE IFNULL(dup.{f}, '') != IFNULL(keep.{f}, '')
+            """ for f in ALL_FIELDS if f != "stencil_no")
+            cur.execute(f"""
+                INSERT INTO stencil_history (stencil_id, changed_column, old_value, new_value)
+                {diff_selects}
+            """)
+            cur.execute("""
+                INSERT INTO stencil_history (stencil_id, changed_column, old_value, new_value)
+                SELECT keep_id, 'merged_from', dup_id, keep_id FROM stencil_dupes
+            """)
+            cur.execute("DELETE FROM stencil_list WHERE id IN (SELECT dup_id FROM stencil_dupes)")
+
+        # cycles are keyed by stencil_no, so they already belong to the kept row;
+        # only one of them may stay open
+        cur.execute("""
+            UPDATE isos_cycles SET cycle_open=0
+            WHERE cycle_open=1 AND id NOT IN (
+                SELECT MAX(id) FROM isos_cycles WHERE cycle_open=1 GROUP BY stencil_no
+            )
+        """)
+        cur.execute("DROP TABLE temp.stencil_dupes")
+        if merged:
+            print(f"🔁 Merged {merged} duplicate stencil row(s)")
+        return merged
+
+    # ==============================================================
+    # 📝 Change History (one write path, history by triggers)
+    # ==============================================================
+    def install_history_triggers(cur):
+        """
+        One AFTER UPDATE OF <column> trigger per field writes stencil_history for
+        every writer - API, ISOS scans, Excel importer - in the same transaction.
+        A trigger only fires for columns named in the UPDATE's SET list.
+        """
+        for f in ALL_FIELDS:
+            cur.execute(f"DROP TRIGGER IF EXISTS trg_stencil_history_{f}")
+            cur.execute(f"""
+                CREATE TRIGGER trg_stencil_history_{f}
+                AFTER UPDATE OF {f} ON stencil_list
+                WHEN IFNULL(OLD.{f}, '') != IFNULL(NEW.{f}, '')
+                BEGIN
+                    INSERT INTO stencil_history (stencil_id, changed_column, old_value, new_value)
+                    VALUES (NEW.id, '{f}', OLD.{f}, NEW.{f});
+                END
+            """)
+
+    def update_stencil_fields(conn, stencil_id, fields, version=None):
+        """
+        UPDATE only the given columns (+ updated_at, row_version). With version set
+        the row is only touched if its row_version still matches.
+        Returns rows touched (0 if nothing to change or the version is stale).
+        """
+        if version is None:
+            return update_stencils_where(conn, "id=?", [stencil_id], fields)
+        return update_stencils_where(conn, "id=? AND row_version=?", [stencil_id, version], fields)
+
+    def update_stencils_where(conn, where, params, fields):
+        """One set-based UPDATE for every row matching where; the history triggers log each changed cell."""
+        fields = {k: v for k, v in fields.items() if k in ALL_FIELDS}
+        if not fields:
+            return 0
+        set_clause = ", ".join(f"{f}=?" for f in fields) + ", updated_at=CURRENT_TIMESTAMP, row_version=row_version+1"
+        return conn.execute(f"UPDATE stencil_list SET {set_clause} WHERE {where}",
+                            [*fields.values(), *params]).rowcount
+
+    # ==============================================================
+    # 📅 Date Fields
+    # ==============================================================
+    # Stored as YYYY-MM-DD so SQLite's date() (status, due lists, sorting) can read
+    # them. Older rows and hand-typed values use these layouts; numeric ones are
+    # read day first. Anything else is kept as typed and gets no revalidation status.
+    DATE_FIELDS = ("date_received", "stencil_validation_dt", "stencil_revalidation_dt")
+    DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y",
+                    "%d/%m/%y", "%d-%m-%y", "%d-%b-%Y", "%d %b %Y", "%d-%b-%y", "%d %B %Y", "%b %d, %Y")
+
+    def iso_date(value):
+        """value as YYYY-MM-DD when it matches one of DATE_FORMATS, else unchanged."""
+        text = str(value or "").strip()
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+            except ValueError:
+                pass
+        return value
+
+    def normalize_stored_dates(cur):
+        """One-off migration: rewrite free-text dates already in stencil_list as ISO."""
+        for field in DATE_FIELDS:
+            rows = cur.execute(f"""
+                SELECT id, {field} FROM stencil_list
+                WHERE IFNULL({field}, '') != '' AND {field} NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+            """).fetchall()
+            fixed = [(iso_date(r[field]), r["id"]) for r in rows if iso_date(r[field]) != r[field]]
+            if fixed:
+                cur.executemany(f"UPDATE stencil_list SET {field}=? WHERE id=?", fixed)
+                print(f"📅 {len(fixed)} {field} values rewritten as YYYY-MM-DD ({len(rows) - len(fixed)} unreadable left as is)")
+
+    # ==============================================================
+    # 🚦 Status Classification (revalidation / tension)
+    # ==============================================================
+    # Thresholds per asset type; override any of them in <BASE_DIR>/status_rules.json,
+    # e.g. {"stencil": {"revalidation_notice_days": 14}}. Read at startup.
+    ASSET_TYPE = "stencil"
+    STATUS_THRESHOLDS = {
+        "stencil": {
+            "revalidation_end_days": 1,       # ≤ 1 day   → case3
+            "revalidation_soon_days": 5,      # ≤ 5 days  → case2
+            "revalidation_notice_days": 10,   # ≤ 10 days → case1
+            "tension_eol_below": 35,          # any tension < 35     → tension-red
+            "tension_reorder_max": 36,        # any tension 35 .. 36 → tension-pink
+        },
+    }
+    STATUS_LABELS = {
+        "tension-red": "STENCIL EOL",
+        "tension-pink": "STENCIL RE-ORDER SOON",
+        "case3": "REVALIDATION TIME END",
+        "case2": "RE-VALIDATION NEED TO DONE SOON",
+        "case1": "RE-VALIDATION NEED TO DONE SOON",
+    }
+    RULES_FILE = os.path.join(BASE_DIR, "status_rules.json")
+
+    def load_status_thresholds():
+        rules = dict(STATUS_THRESHOLDS[ASSET_TYPE])
+        if os.path.exists(RULES_FILE):
+            try:
+                with open(RULES_FILE, encoding="utf-8") as f:
+                    overrides = json.load(f).get(ASSET_TYPE, {})
+                rules.update({k: float(v) for k, v in overrides.items() if k in rules})
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                print(f"⚠️ Ignoring {RULES_FILE}: {e}")
+        return rules
+
+    status_rules = load_status_thresholds()
+
+    def status_class_sql(rules, prefix=""):
+        """
+        SQL CASE giving a row's status class, evaluated by SQLite for the whole
+        table at once. Tensions win over revalidation and are checked A..E,
+        first hit decides (same order the status page used to apply in JS).
+        """
+        def num(col):
+            # tensions are TEXT; '' or junk must not read as 0
+            c = f"TRIM(IFNULL({prefix}{col}, ''))"
+            return f"(CASE WHEN {c} GLOB '[0-9]*' OR {c} GLOB '.[0-9]*' THEN CAST({c} AS REAL) END)"
+
+        eol = float(rules["tension_eol_below"])
+        reorder = float(rules["tension_reorder_max"])
+        whens = []
+        for col in TENSION_FIELDS:
+            whens.append(f"WHEN {num(col)} < {eol} THEN 'tension-red'")
+            whens.append(f"WHEN {num(col)} <= {reorder} THEN 'tension-pink'")
+
+        days = f"(julianday(date({prefix}stencil_revalidation_dt)) - julianday(date('now', 'localtime')))"
+        whens.append(f"WHEN {days} <= {float(rules['revalidation_end_days'])} THEN 'case3'")
+        whens.append(f"WHEN {days} <= {float(rules['revalidation_soon_days'])} THEN 'case2'")
+        whens.append(f"WHEN {days} <= {float(rules['revalidation_notice_days'])} THEN 'case1'")
+        return "CASE " + " ".join(whens) + " END"
+
+    def status_label_sql(cls_expr):
+        return f"CASE {cls_expr} " + " ".join(f"WHEN '{k}' THEN '{v}'" for k, v in STATUS_LABELS.items()) + " END"
+
+    def install_status_triggers(cur):
+        """Reclassify a row inside every INSERT/UPDATE, whoever writes it (app or importer)."""
+        cls = status_class_sql(status_rules, prefix="NEW.")
+        body = f"""
+            UPDATE stencil_list SET status_class = {cls} WHERE id = NEW.id;
+            UPDATE stencil_list SET derived_status = {status_label_sql("status_class")} WHERE id = NEW.id;
+        """
+        cur.execute("DROP TRIGGER IF EXISTS trg_stencil_status_insert")
+        cur.execute("DROP TRIGGER IF EXISTS trg_stencil_status_update")
+        cur.execute(f"""
+            CREATE TRIGGER trg_stencil_status_insert AFTER INSERT ON stencil_list
+            BEGIN {body} END
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER trg_stencil_status_update
+            AFTER UPDATE OF stencil_revalidation_dt, {', '.join(TENSION_FIELDS)} ON stencil_list
+            BEGIN {body} END
+        """)
+
+    def refresh_derived_status(conn, due_only=False):
+        """
+        Reclassify the fleet in one UPDATE; only rows whose class changed are written.
+        due_only limits it to the revalidation-date index range that can have crossed a
+        day boundary (tension classes don't change with time, edits go through the triggers).
+        """
+        where, params = "", []
+        if due_only:
+            where = "WHERE stencil_revalidation_dt <= date('now', 'localtime', ?)"
+            params = [f"+{int(status_rules['revalidation_notice_days']) + 1} days"]
+        cur = conn.execute(f"""
+            UPDATE stencil_list
+            SET status_class = c.cls, derived_status = {status_label_sql("c.cls")}
+            FROM (SELECT id, {status_class_sql(status_rules)} AS cls FROM stencil_list {where}) AS c
+            WHERE stencil_list.id = c.id AND stencil_list.status_class IS NOT c.cls
+        """, params)
+        status_refreshed_on[0] = datetime.date.today()
+        return cur.rowcount
+
+    status_refreshed_on = [None]
+
+    def ensure_status_fresh():
+        """Day-bucket boundaries move at midnight; reclassify once per day on first use."""
+        if status_refreshed_on[0] != datetime.date.today():
+            conn = get_db()
+            changed = refresh_derived_status(conn, due_only=True)
+            conn.commit()
+            conn.close()
+            print(f"🚦 Status classes refreshed ({changed} changed)")
+
+    # ==============================================================
+    # 🔔 Revalidation / Tension Alerts
+    # ==============================================================
+    ALERT_SEVERITY = {
+        "tension-red": "critical",
+        "case3": "critical",
+        "tension-pink": "warning",
+        "case2": "warning",
+        "case1": "info",
+    }
+    ALERT_SCAN_INTERVAL = 60 * 60  # 1 hour
+
+    def sync_alerts(conn):
+        """
+        Bring the open alerts in line with stencil_list.status_class. Reads only
+        flagged stencils and open alerts (both indexed) and writes only the
+        alerts that were raised or cleared. Returns (raised, resolved).
+        """
+        severity = "CASE s.status_class " + " ".join(
+            f"WHEN '{k}' THEN '{v}'" for k, v in ALERT_SEVERITY.items()) + " END"
+        resolved = conn.execute("""
+            UPDATE alerts SET resolved_at = CURRENT_TIMESTAMP
+            WHERE resolved_at IS NULL AND NOT EXISTS (
+                SELECT 1 FROM stencil_list s
+                WHERE s.id = alerts.asset_id
+                  AND s.status_class = alerts.status_class
+                  AND s.condition_status != 'SCRAP'
+            )
+        """).rowcount
+        raised = conn.execute(f"""
+            INSERT OR IGNORE INTO alerts (asset_id, asset_no, status_class, severity, message)
+            SELECT s.id, s.stencil_no, s.status_class, {severity}, s.derived_status
+            FROM stencil_list s
+            WHERE s.status_class IS NOT NULL
+              AND s.condition_status != 'SCRAP'
+              AND NOT EXISTS (SELECT 1 FROM alerts a WHERE a.asset_id = s.id AND a.resolved_at IS NULL)
+        """).rowcount
+        return raised, resolved
+
+    def alert_scanner_job():
+        """Background job: daily reclassification + hourly incremental alert sync."""
+        while True:
+            try:
+                ensure_status_fresh()
+                conn = get_db()
+                raised, resolved = sync_alerts(conn)
+                conn.commit()
+                conn.close()
+                if raised or resolved:
+                    print(f"🔔 Alerts: {raised} raised, {resolved} resolved")
+            except sqlite3.Error as e:
+                print(f"❌ Alert scan failed: {e}")
+            time.sleep(ALERT_SCAN_INTERVAL)
+
+    def start_alert_thread():
+        t = threading.Thread(target=alert_scanner_job, daemon=True)
+        t.start()
+        print("🔔 Alert scanner thread started")
+
+    # ==============================================================
+    # 🕰 Point-in-time Reconstruction (snapshots + history replay)
+    # ==============================================================
+    SNAPSHOT_INTERVAL_DAYS = 7
+    SNAPSHOT_CHECK_INTERVAL = 6 * 60 * 60  # seconds
+    # newest snapshot per week for this many weeks, plus the newest per month for
+    # this many months; older ones are pruned. History is never pruned, so an as-of
+    # date before the oldest kept snapshot is still rebuilt, only by a longer replay.
+    SNAPSHOT_RETENTION = {"weekly": 8, "monthly": 12}
+
+    def take_snapshot(conn):
+        """Store every stencil's current fields as one compact JSON row. Returns the snapshot id."""
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO stencil_snapshots (history_id)
+            SELECT IFNULL(MAX(id), 0) FROM stencil_history
+        """)
+        snapshot_id = cur.lastrowid
+        cols = ", ".join(f"'{f}', {f}" for f in ALL_FIELDS + ["created_at"])
+        cur.execute(f"""
+            INSERT INTO stencil_snapshot_rows (snapshot_id, stencil_id, data)
+            SELECT ?, id, json_object({cols}) FROM stencil_list
+        """, (snapshot_id,))
+        return snapshot_id
+
+    def prune_snapshots(conn):
+        """Drop snapshots outside SNAPSHOT_RETENTION; returns how many went."""
+        old = [r["id"] for r in conn.execute("""
+            WITH ranked AS (
+                SELECT id,
+                       DENSE_RANK() OVER (ORDER BY strftime('%Y-%W', taken_at) DESC) AS week_rank,
+                       ROW_NUMBER() OVER (PARTITION BY strftime('%Y-%W', taken_at) ORDER BY taken_at DESC, id DESC) AS in_week,
+                       DENSE_RANK() OVER (ORDER BY strftime('%Y-%m', taken_at) DESC) AS month_rank,
+                       ROW_NUMBER() OVER (PARTITION BY strftime('%Y-%m', taken_at) ORDER BY taken_at DESC, id DESC) AS in_month
+                FROM stencil_snapshots
+            )
+            SELECT id FROM ranked
+            WHERE NOT ((week_rank <= ? AND in_week = 1) OR (month_rank <= ? AND in_month = 1))
+        """, (SNAPSHOT_RETENTION["weekly"], SNAPSHOT_RETENTION["monthly"]))]
+        ids = json.dumps(old)
+        conn.execute("DELETE FROM stencil_snapshot_rows WHERE snapshot_id IN (SELECT value FROM json_each(?))", (ids,))
+        conn.execute("DELETE FROM stencil_snapshots WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+        return len(old)
+
+    def take_snapshot_if_due():
+        conn = get_db()
+
+        def snapshot_due():
+            return conn.execute("""
+                SELECT COALESCE(MAX(taken_at) < datetime('now', ?), 1) AS due FROM stencil_snapshots
+            """, (f"-{SNAPSHOT_INTERVAL_DAYS} days",)).fetchone()["due"]
+
+        if snapshot_due():
+            # the history read and the snapshot insert must see the same data;
+            # ask again under the write lock in case another worker just took one
+            conn.execute("BEGIN IMMEDIATE")
+            if not snapshot_due():
+                conn.rollback()
+                conn.close()
+                return
+            snapshot_id = take_snapshot(conn)
+            pruned = prune_snapshots(conn)
+            conn.commit()
+            print(f"📸 History snapshot #{snapshot_id} taken" + (f", {pruned} old ones pruned" if pruned else ""))
+        conn.close()
+
+    def snapshot_job():
+        """Background job: keep a snapshot at most SNAPSHOT_INTERVAL_DAYS old."""
+        while True:
+            try:
+                take_snapshot_if_due()
+            except sqlite3.Error as e:
+                print(f"❌ History snapshot failed: {e}")
+            time.sleep(SNAPSHOT_CHECK_INTERVAL)
+
+    def start_snapshot_thread():
+        t = threading.Thread(target=snapshot_job, daemon=True)
+        t.start()
+        print("📸 History snapshot thread started")
+
+    def parse_as_of(value, day_end=True):
+        """
+        'YYYY-MM-DD' (end of that day, or its start with day_end=False, in server
+        local time) or an ISO datetime (UTC unless it has an offset) -> UTC
+        'YYYY-MM-DD HH:MM:SS' like changed_at.
+        """
+        value = (value or "").strip()
+        if len(value) == 10:
+            # naive -> astimezone() reads it as local time
+            at = datetime.datetime.fromisoformat(value + ("T23:59:59" if day_end else "T00:00:00")).astimezone()
+        else:
+            at = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if at.tzinfo is not None:
+            at = at.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return at.strftime("%Y-%m-%d %H:%M:%S")
+
+    def stencils_as_of(conn, at, stencil_id=None):
+        """
+        Rebuild stencil rows as they were at `at`. Start from the first snapshot taken
+        at/after `at` (or the live table when there is none) and walk back: each column
+        changed after `at` takes the old_value of its earliest such change.
+        Returns (rows, source).
+        """
+        snap = conn.execute("""
+            SELECT id, taken_at, history_id FROM stencil_snapshots
+            WHERE taken_at >= ? ORDER BY taken_at, id LIMIT 1
+        """, (at,)).fetchone()
+
+        id_filter = "" if stencil_id is None else " AND stencil_id = ?"
+        id_params = [] if stencil_id is None else [stencil_id]
+        if snap:
+            source = f"snapshot #{snap['id']} ({snap['taken_at']})"
+            base = {r["stencil_id"]: json.loads(r["data"]) for r in conn.execute(
+                "SELECT stencil_id, data FROM stencil_snapshot_rows WHERE snapshot_id = ?" + id_filter,
+                [snap["id"], *id_params])}
+            history_id = snap["history_id"]
+        else:
+            source = "live"
+            base = {r["id"]: dict(r) for r in conn.execute(
+                "SELECT * FROM stencil_list" + ("" if stencil_id is None else " WHERE id = ?"), id_params)}
+            history_id = None
+
+        deltas = conn.execute(f"""
+            SELECT stencil_id, changed_column, old_value FROM (
+                SELECT stencil_id, changed_column, old_value,
+                       ROW_NUMBER() OVER (PARTITION BY stencil_id, changed_column
+                                          ORDER BY changed_at, id) AS rn
+                FROM stencil_history
+                WHERE changed_at > ? {'' if history_id is None else 'AND id <= ?'}{id_filter}
+                  AND changed_column IN ({', '.join('?' * len(ALL_FIELDS))})
+            ) WHERE rn = 1
+        """, [at, *([] if history_id is None else [history_id]), *id_params, *ALL_FIELDS]).fetchall()
+        for d in deltas:
+            if d["stencil_id"] in base:
+                base[d["stencil_id"]][d["changed_column"]] = d["old_value"]
+
+        rows = [{"id": sid, **{f: data.get(f) for f in ALL_FIELDS}}
+                for sid, data in sorted(base.items())
+                if str(data.get("created_at") or "") <= at]
+        return rows, source
+
     # ==============================================================
     # 💾 Backup System (Weekly)
     # ==============================================================
-    def backup_db():
-        """Create timestamped .bak copy of the database."""
-        if os.path.exists(LOCAL_DB):
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_name = os.path.join(BACKUP_DIR, f"stencil_{timestamp}.bak")
-            shutil.copy2(LOCAL_DB, backup_name)
-            print(f"🗄 Backup created at {backup_name}")
-
-    def weekly_backup_job():
-        """Background job that runs every week."""
+    BACKUP_PAGES_PER_STEP = 256  # pages copied per step; writers can get in between steps
+    BACKUP_STEP_SLEEP = 0.05     # seconds
+    BACKUP_CATALOG = os.path.join(BACKUP_DIR, "catalog.json")
+    # grandfather-father-son: newest backup of each of the last N days / ISO weeks / months,
+    # on top of every backup from the last BACKUP_KEEP_ALL_HOURS
+    BACKUP_RETENTION = {"daily": 7, "weekly": 4, "monthly": 12}
+    BACKUP_KEEP_ALL_HOURS = 24
+    backup_lock = threading.RLock()
+
+    # ---------------- Scheduler state & inter-process lock ----------------
+    # Every waitress process runs the scheduler thread; the lock file makes sure only
+    # one of them backs up, and schedule.json keeps the last run across restarts.
+    BACKUP_INTERVAL = 24 * 60 * 60       # seconds; incremental unless a full one is due
+    BACKUP_POLL_INTERVAL = 10 * 60       # seconds between "is a backup due?" checks
+    BACKUP_LOCK_STALE = 60 * 60          # a lock file this old is left over from a crash
+    BACKUP_STATE = os.path.join(BACKUP_DIR, "schedule.json")
+    BACKUP_LOCK_FILE = os.path.join(BACKUP_DIR, "backup.lock")
+    lock_depth = [0]
+
+    def load_backup_state():
+        try:
+            with open(BACKUP_STATE, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_backup_state(**changes):
+        state = load_backup_state()
+        state.update(changes)
+        tmp = BACKUP_STATE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=1)
+        os.replace(tmp, BACKUP_STATE)
+
+    def next_backup_run(state=None):
+        last = (state if state is not None else load_backup_state()).get("last_run")
+        if not last:
+            return datetime.datetime.now()
+        return datetime.datetime.fromisoformat(last) + datetime.timedelta(seconds=BACKUP_INTERVAL)
+
+    def backup_is_due(now):
+        state = load_backup_state()
+        return not state.get("last_run") or next_backup_run(state) <= now
+
+    def backup_running():
+        try:
+            return time.time() - os.path.getmtime(BACKUP_LOCK_FILE) < BACKUP_LOCK_STALE
+        except FileNotFoundError:
+            return False
+
+    def acquire_lock_file():
+        for _ in range(2):
+            try:
+                fd = os.open(BACKUP_LOCK_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+                with os.fdopen(fd, "w") as f:
+                    f.write(f"{os.getpid()} {datetime.datetime.now().isoformat(timespec='seconds')}")
+                return True
+            except FileExistsError:
+                if backup_running():
+                    return False
+                try:
+                    os.remove(BACKUP_LOCK_FILE)
+                except FileNotFoundError:
+                    pass
+        return False
+
+    @contextlib.contextmanager
+    def exclusive_backup():
+        """Thread + inter-process lock for backup/restore work; yields False if another process has it."""
+        with backup_lock:
+            if lock_depth[0] == 0 and not acquire_lock_file():
+                yield False
+                return
+            lock_depth[0] += 1
+            try:
+                yield True
+            finally:
+                lock_depth[0] -= 1
+                if lock_depth[0] == 0:
+                    try:
+                        os.remove(BACKUP_LOCK_FILE)
+                    except FileNotFoundError:
+                        pass
+
+    def load_backup_catalog():
+        try:
+            with open(BACKUP_CATALOG, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def save_backup_catalog(entries):
+        tmp = BACKUP_CATALOG + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f, indent=1)
+        os.replace(tmp, BACKUP_CATALOG)
+
+    def file_sha256(path):
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def online_copy(dest):
+        """
+        Copy LOCAL_DB to dest with the SQLite online backup API (never a torn copy
+        of a live file) and integrity_check the copy. Returns (pages, integrity).
+        """
+        pages = [0]
+
+        def progress(status, remaining, total):
+            pages[0] = total
+
+        src = sqlite3.connect(LOCAL_DB)
+        dst = sqlite3.connect(dest)
+        try:
+            src.backup(dst, pages=BACKUP_PAGES_PER_STEP, progress=progress, sleep=BACKUP_STEP_SLEEP)
+            integrity = dst.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            dst.close()
+            src.close()
+        return pages[0], integrity
+
+    def retention_keep(entries):
+        """
+        File names the GFS policy keeps; entries are catalog dicts. An incremental
+        backup that is kept also keeps the full backup it is based on.
+        """
+        newest_first = sorted(entries, key=lambda e: e["created_at"], reverse=True)
+        tiers = {
+            "daily": lambda d: d.date(),
+            "weekly": lambda d: d.isocalendar()[:2],
+            "monthly": lambda d: (d.year, d.month),
+        }
+        recent = (datetime.datetime.now() - datetime.timedelta(hours=BACKUP_KEEP_ALL_HOURS)).isoformat()
+        keep = {e["file"] for e in entries if e["created_at"] >= recent}
+        for tier, bucket in tiers.items():
+            seen = set()
+            for e in newest_first:
+                key = bucket(datetime.datetime.fromisoformat(e["created_at"]))
+                if key in seen:
+                    continue
+                if len(seen) == BACKUP_RETENTION[tier]:
+                    break
+                seen.add(key)
+                keep.add(e["file"])
+        keep |= {e["base"] for e in entries if e["file"] in keep and e.get("base")}
+        return keep
+
+    def apply_backup_retention(entries):
+        keep = retention_keep(entries)
+        for e in entries:
+            if e["file"] not in keep:
+                for path in (e["file"], e["file"] + ".chunks.json"):
+                    try:
+                        os.remove(os.path.join(BACKUP_DIR, path))
+                    except FileNotFoundError:
+                        pass
+                print(f"🧹 Backup pruned: {e['file']}")
+        kept = [e for e in entries if e["file"] in keep]
+        prune_chunks(kept)
+        return kept
+
+    # ---------------- Incremental (chunk store) ----------------
+    # The DB is cut into fixed BACKUP_CHUNK_SIZE blocks (a whole number of pages).
+    # A full backup records the sha256 of every block; an incremental one stores
+    # only blocks that differ from its full backup, gzipped under chunks/<sha256>.
+    BACKUP_CHUNK_SIZE = 64 * 1024
+    BACKUP_FULL_EVERY_DAYS = 7
+    CHUNK_DIR = os.path.join(BACKUP_DIR, "chunks")
+
+    def chunk_path(digest):
+        return os.path.join(CHUNK_DIR, digest[:2], digest)
+
+    def read_manifest(entry):
+        with open(os.path.join(BACKUP_DIR, entry["file"]), encoding="utf-8") as f:
+            return json.load(f)
+
+    def prune_chunks(entries):
+        """Delete chunk files no kept incremental manifest refers to."""
+        if not os.path.isdir(CHUNK_DIR):
+            return
+        used = set()
+        for e in entries:
+            if e.get("kind") == "incremental":
+                try:
+                    used.update(read_manifest(e)["changed"].values())
+                except (OSError, ValueError):
+                    pass
+        for sub in os.listdir(CHUNK_DIR):
+            for digest in os.listdir(os.path.join(CHUNK_DIR, sub)):
+                if digest not in used:
+                    os.remove(os.path.join(CHUNK_DIR, sub, digest))
+
+    def read_chunks(path):
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(BACKUP_CHUNK_SIZE), b""):
+                yield block
+
+    def write_full(raw, dest):
+        """gzip raw into dest and write the block hashes next to it. Returns bytes written."""
+        hashes = []
+        with gzip.open(dest, "wb", compresslevel=6) as g:
+            for block in read_chunks(raw):
+                hashes.append(hashlib.sha256(block).hexdigest())
+                g.write(block)
+        with open(dest + ".chunks.json", "w", encoding="utf-8") as f:
+            json.dump({"chunk_size": BACKUP_CHUNK_SIZE, "hashes": hashes}, f)
+        return os.path.getsize(dest)
+
+    def write_incremental(raw, dest, base):
+        """Store blocks that differ from base in the chunk store; dest gets the manifest."""
+        with open(os.path.join(BACKUP_DIR, base["file"] + ".chunks.json"), encoding="utf-8") as f:
+            base_hashes = json.load(f)["hashes"]
+        changed, new_bytes = {}, 0
+        for idx, block in enumerate(read_chunks(raw)):
+            digest = hashlib.sha256(block).hexdigest()
+            if idx < len(base_hashes) and base_hashes[idx] == digest:
+                continue
+            changed[str(idx)] = digest
+            path = chunk_path(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                data = gzip.compress(block, compresslevel=6)
+                with open(path + ".tmp", "wb") as f:
+                    f.write(data)
+                os.replace(path + ".tmp", path)
+                new_bytes += len(data)
+        with open(dest, "w", encoding="utf-8") as f:
+            json.dump({"base": base["file"], "chunk_size": BACKUP_CHUNK_SIZE,
+                       "db_size": os.path.getsize(raw), "changed": changed}, f)
+        return os.path.getsize(dest) + new_bytes, len(changed)
+
+    def materialize_backup(entry, dest):
+        """Rebuild the database file of any catalog entry (full or incremental) at dest."""
+        base = entry
+        manifest = None
+        if entry.get("kind") == "incremental":
+            manifest = read_manifest(entry)
+            base = next(e for e in load_backup_catalog() if e["file"] == manifest["base"])
+        with gzip.open(os.path.join(BACKUP_DIR, base["file"]), "rb") as g, open(dest, "wb") as f:
+            shutil.copyfileobj(g, f, 1 << 20)
+        if manifest is None:
+            return
+        with open(dest, "r+b") as f:
+            for idx, digest in manifest["changed"].items():
+                with open(chunk_path(digest), "rb") as c:
+                    block = gzip.decompress(c.read())
+                if hashlib.sha256(block).hexdigest() != digest:
+                    raise ValueError(f"Chunk {digest} is corrupt")
+                f.seek(int(idx) * manifest["chunk_size"])
+                f.write(block)
+            f.truncate(manifest["db_size"])
+
+    def backup_db(kind=None, scheduled=False):
+        """
+        Online-copy the database, integrity_check it and store it as a full backup
+        (stencil_<timestamp>.db.gz) or an incremental one (stencil_<timestamp>.inc.json
+        + changed chunks). kind=None takes a full backup when the last one is older
+        than BACKUP_FULL_EVERY_DAYS. Records it in catalog.json and prunes by
+        BACKUP_RETENTION. scheduled=True skips the run unless it is due.
+        Returns the catalog entry, or None when nothing was backed up (no database,
+        bad copy, not due, or another process is backing up).
+        """
+        if not os.path.exists(LOCAL_DB):
+            return None
+        with exclusive_backup() as locked:
+            if not locked:
+                print("⏳ Backup skipped: another process is running one")
+                return None
+            now = datetime.datetime.now()
+            # re-checked under the lock: another process may have just run it
+            if scheduled and not backup_is_due(now):
+                return None
+            catalog = load_backup_catalog()
+            fulls = [e for e in catalog if e.get("kind", "full") == "full"
+                     and os.path.exists(os.path.join(BACKUP_DIR, e["file"] + ".chunks.json"))]
+            base = max(fulls, key=lambda e: e["created_at"], default=None)
+            if kind is None:
+                due = base is None or datetime.datetime.fromisoformat(base["created_at"]) < \
+                    now - datetime.timedelta(days=BACKUP_FULL_EVERY_DAYS)
+                kind = "full" if due else "incremental"
+            if kind == "incremental" and base is None:
+                kind = "full"
+
+            ext = ".db.gz" if kind == "full" else ".inc.json"
+            stamp = now.strftime('%Y%m%d_%H%M%S')
+            name, n = f"stencil_{stamp}{ext}", 1
+            while os.path.exists(os.path.join(BACKUP_DIR, name)):  # two backups in one second
+                n += 1
+                name = f"stencil_{stamp}_{n}{ext}"
+            dest = os.path.join(BACKUP_DIR, name)
+            raw = os.path.join(BACKUP_DIR, f"stencil_{stamp}_{n}.tmp")
+
+            t0 = time.perf_counter()
+            pages, integrity = online_copy(raw)
+            if integrity != "ok":
+                os.replace(raw, raw + ".corrupt")
+                print(f"❌ Backup failed integrity check ({integrity}), kept as {raw}.corrupt")
+                save_backup_state(last_error=f"{now.isoformat(timespec='seconds')}: integrity check {integrity}")
+                return None
+            # the online backup needs a real database file, so the copy is packed right after
+            db_size = os.path.getsize(raw)
+            entry = {"file": name, "kind": kind, "created_at": now.isoformat(timespec="seconds")}
+            if kind == "full":
+                entry["size"] = write_full(raw, dest)
+            else:
+                entry["size"], entry["changed_chunks"] = write_incremental(raw, dest, base)
+                entry["base"] = base["file"]
+            os.remove(raw)
+            seconds = time.perf_counter() - t0
+
+            entry.update({
+                "pages": pages,
+                "db_size": db_size,
+                "sha256": file_sha256(dest),
+                "seconds": round(seconds, 3),
+                "pages_per_sec": round(pages / seconds) if seconds else None,
+            })
+            save_backup_catalog(apply_backup_retention(catalog + [entry]))
+            save_backup_state(last_run=entry["created_at"], last_file=name, last_kind=kind, last_error=None)
+        print(f"🗄 {kind.capitalize()} backup created at {dest} "
+              f"({pages} pages in {entry['seconds']}s, {entry['pages_per_sec']} pages/s, "
+              f"{db_size} -> {entry['size']} bytes, integrity ok)")
+        return entry
+
+    def restore_backup(file_name):
+        """
+        Verify the checksum, rebuild the database next to LOCAL_DB and copy it into
+        the live file with the backup API (open connections stay valid).
+        The current database is backed up first. Returns (ok, message).
+        """
+        raw = LOCAL_DB + ".restore"
+        with exclusive_backup() as locked:
+            if not locked:
+                return False, "Another backup or restore is running, try again shortly"
+            entry = next((e for e in load_backup_catalog() if e["file"] == file_name), None)
+            if entry is None:
+                return False, f"Unknown backup: {file_name}"
+            path = os.path.join(BACKUP_DIR, entry["file"])
+            if not os.path.exists(path) or file_sha256(path) != entry["sha256"]:
+                return False, f"Backup file missing or checksum mismatch: {file_name}"
+            try:
+                materialize_backup(entry, raw)
+                src = sqlite3.connect(raw)
+                try:
+                    integrity = src.execute("PRAGMA integrity_check").fetchone()[0]
+                    if integrity != "ok":
+                        return False, f"Backup failed integrity check: {integrity}"
+                    # safety copy of what is being replaced (may prune the source, already rebuilt)
+                    backup_db()
+                    dst = sqlite3.connect(LOCAL_DB)
+                    try:
+                        src.backup(dst)
+                    finally:
+                        dst.close()
+                finally:
+                    src.close()
+            except (OSError, ValueError, StopIteration) as e:
+                return False, f"Could not rebuild {file_name}: {e}"
+            finally:
+                if os.path.exists(raw):
+                    os.remove(raw)
+        print(f"♻️ Database restored from {file_name}")
+        return True, f"Restored {file_name}"
+
+    def backup_scheduler_job():
+        """Background job: back up whenever schedule.json says a run is due (daily by default)."""
         while True:
-            backup_db()
-            time.sleep(7 * 24 * 60 * 60)  # 7 days
+            try:
+                if backup_is_due(datetime.datetime.now()):
+                    backup_db(scheduled=True)
+            except (OSError, sqlite3.Error) as e:
+                print(f"❌ Scheduled backup failed: {e}")
+                save_backup_state(last_error=f"{datetime.datetime.now().isoformat(timespec='seconds')}: {e}")
+            time.sleep(BACKUP_POLL_INTERVAL)
 
     def start_backup_thread():
-        t = threading.Thread(target=weekly_backup_job, daemon=True)
+        t = threading.Thread(target=backup_scheduler_job, daemon=True)
         t.start()
-        print("🕒 Weekly backup thread started")
+        print(f"🕒 Backup scheduler started (next run {next_backup_run().isoformat(timespec='minutes')})")
+
+    # ==============================================================
+    # 📥 Import Jobs (uploaded master sheet -> background streaming import)
+    # ==============================================================
+    IMPORT_DIR = os.path.join(BASE_DIR, "imports")
+    IMPORT_EXTENSIONS = (".xlsx", ".xlsm", ".xls", ".csv")
+    IMPORT_BATCH_SIZE = 2000  # rows per commit: each write lock stays short, so scans barely wait
+    IMPORT_JOBS_KEEP = 20     # finished jobs kept for /api/jobs/<id>
+    import_jobs = {}
+    import_jobs_lock = threading.Lock()
+    import_worker_lock = threading.Lock()  # one import at a time, SQLite has a single writer
+
+    def update_import_job(job_id, **changes):
+        with import_jobs_lock:
+            import_jobs[job_id].update(changes)
+
+    def run_import_job(job_id, path, dry_run):
+        """Worker thread: wait for the previous import, then stream the file into stencil_list."""
+        def progress(rows, seconds):
+            update_import_job(job_id, rows=rows, seconds=round(seconds, 1),
+                              rows_per_sec=round(rows / seconds) if seconds else None)
+
+        with import_worker_lock:
+            update_import_job(job_id, status="running",
+                              started_at=datetime.datetime.now().isoformat(timespec="seconds"))
+            try:
+                # pandas/openpyxl only load once an import actually runs, not at startup
+                import AssetImportDB
+                schema = AssetImportDB.make_schema("stencil", ALL_FIELDS, unique="stencil_no")
+                summary = AssetImportDB.import_stream(schema, path, LOCAL_DB, IMPORT_BATCH_SIZE, progress, dry_run)
+            except ImportError as e:
+                # AssetImportDB.py sits in the repo root: on sys.path under waitress
+                # (stencil_app.app:app) and bundled by Stencil_Master.spec
+                update_import_job(job_id, status="failed", error=f"Importer not available: {e}")
+            except ValueError as e:
+                update_import_job(job_id, status="failed", error=str(e))
+            except Exception as e:
+                rows = import_jobs[job_id]["rows"]
+                update_import_job(job_id, status="failed",
+                                  error=f"Import stopped after {rows} rows (earlier batches are saved): {e}")
+                print(f"❌ Import job {job_id} failed: {e}")
+            else:
+                update_import_job(job_id, status="done", rows=summary["rows"], summary=summary)
+                print(f"📥 Import job {job_id}: {summary['rows']} rows in {summary['seconds']}s")
+            finally:
+                update_import_job(job_id, finished_at=datetime.datetime.now().isoformat(timespec="seconds"))
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+
+    def start_import_job(upload, dry_run):
+        """Save the upload to IMPORT_DIR (copied in chunks) and queue it. Returns the job dict."""
+        os.makedirs(IMPORT_DIR, exist_ok=True)
+        job_id = secrets.token_hex(8)
+        path = os.path.join(IMPORT_DIR, job_id + os.path.splitext(upload.filename)[1].lower())
+        upload.save(path)
+        job = {"id": job_id, "file": upload.filename, "size": os.path.getsize(path), "dry_run": dry_run,
+               "status": "queued", "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+               "started_at": None, "finished_at": None, "rows": 0, "seconds": 0, "rows_per_sec": None,
+               "error": None, "summary": None}
+        with import_jobs_lock:
+            finished = sorted((j for j in import_jobs.values() if j["finished_at"]), key=lambda j: j["created_at"])
+            for old in finished[:max(len(finished) - IMPORT_JOBS_KEEP + 1, 0)]:
+                del import_jobs[old["id"]]
+            import_jobs[job_id] = job
+        threading.Thread(target=run_import_job, args=(job_id, path, dry_run), daemon=True).start()
+        return job
 
     # Initialize DB & start backup system
     os.makedirs(BASE_DIR, exist_ok=True)
+    mark_phase("helpers")
     init_db()
+    mark_phase("init_db")
     start_backup_thread()
+    start_alert_thread()
+    start_snapshot_thread()
+    mark_phase("background threads")
 
     # ==============================================================
     # ⚙️ Existing App Logic
@@ -159,20 +1183,20 @@ def create_app():
 
     # --- Your full existing route logic stays here ---
     # ---------------- Utilities ----------------
-    SHORT_FIELDS = ["fg","side","customer","stencil_no","rack_no","location"]
-    ALL_FIELDS = SHORT_FIELDS + [
-        "stencil_mils","stencil_mils_usl","stencil_mils_lsl","stencil_supplier",
-        "stencil_pr_no","date_received","stencil_validation_dt","stencil_revalidation_dt",
-        "tension_a","tension_b","tension_c","tension_d","tension_e","received_by",
-        "condition_status","production_status","emp_id","remarks"
-    ]
-
     def to_upper(d: dict):
         out = {}
         for k, v in d.items():
             out[k] = "" if v is None else str(v).strip().upper()
         return out
 
+    def clean_fields(d: dict):
+        """to_upper plus the date fields as YYYY-MM-DD: what every write stores."""
+        out = to_upper(d)
+        for k in DATE_FIELDS:
+            if out.get(k):
+                out[k] = iso_date(out[k])
+        return out
+
     def row_to_dict(row, fields=None):
         if row is None:
             return None
@@ -180,20 +1204,326 @@ def create_app():
             fields = ["id"] + ALL_FIELDS
         return {k: row[k] for k in fields if (k == "id" or k in row.keys())}
 
-    def check_credentials(payload):
-        """Validate username & password and return (ok, emp_id)"""
-        username = payload.get("username")
-        password = payload.get("password")
+    # ---------------- Session Tokens ----------------
+    # /api/login hands out a signed, expiring token; mutations verify its HMAC
+    # instead of re-running PBKDF2 on a password for every call.
+    SESSION_TOKEN_TTL = 8 * 60 * 60  # one shift
+    TOKEN_SCOPES = {"add", "update", "action", "delete"}
+    TOKEN_KEY_FILE = os.path.join(BASE_DIR, "session.key")
+
+    def load_token_key():
+        """Per-install signing key, shared by every waitress process and kept across restarts."""
+        try:
+            fd = os.open(TOKEN_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+        except FileExistsError:
+            pass
+        with open(TOKEN_KEY_FILE) as f:
+            return f.read().strip()
+
+    token_signer = URLSafeTimedSerializer(load_token_key(), salt="stencil-session")
+
+    def issue_token(user, scopes=None):
+        """Sign a session token for a users row, bound to its current token_version."""
+        scopes = sorted(TOKEN_SCOPES & {str(x).lower() for x in scopes}) if scopes else sorted(TOKEN_SCOPES)
+        data = {"i": user["id"], "v": user["token_version"], "u": user["username"], "e": user["emp_id"], "s": scopes}
+        return token_signer.dumps(data), scopes
+
+    def token_data(token, scope=None):
+        """
+        The payload of a valid, unexpired token that carries scope, else None.
+        The user must still exist with the same token_version, so changing the
+        username, password or emp_id revokes every token issued before.
+        """
+        try:
+            data = token_signer.loads(token, max_age=SESSION_TOKEN_TTL)
+        except BadSignature:  # also covers SignatureExpired
+            return None
+        if scope and scope not in data.get("s", []):
+            return None
+        conn = get_db()
+        row = conn.execute("SELECT username, emp_id, token_version FROM users WHERE id=?",
+                           (data.get("i"),)).fetchone()
+        conn.close()
+        if not row or row["token_version"] != data.get("v"):
+            return None
+        return dict(data, u=row["username"], e=row["emp_id"])
+
+    def verify_token(token, scope=None):
+        """Return (ok, emp_id) for a valid, unexpired token that carries scope."""
+        data = token_data(token, scope)
+        return (True, data.get("e")) if data else (False, None)
+
+    # ---------------- Login Throttling ----------------
+    # Token buckets spent before any PBKDF2 work: kind -> (burst capacity, seconds
+    # to refill one attempt). "ip" per client IP, "client" per username from that
+    # IP (tight, so one machine guessing is slowed early), "user" per account
+    # whatever the IP (roomier and slower, so rotating IPs still hits a ceiling
+    # without a few typos locking the account). A correct password gives the
+    # attempt back, so only failures add up.
+    THROTTLE_RULES = {"ip": (20, 3.0), "client": (5, 30.0), "user": (30, 120.0)}
+    # False: buckets live in this process only. True: kept in the login_throttle
+    # table, so all waitress processes share them and restarts don't reset them.
+    app.config.setdefault("THROTTLE_PERSIST", False)
+    THROTTLE_MAX_BUCKETS = 10000
+    throttle_buckets = {}
+    throttle_lock = threading.Lock()
+    auth_metrics = {"login_attempts": 0, "throttled_ip": 0, "throttled_client": 0, "throttled_user": 0,
+                    "hash_calls": 0, "hash_seconds": 0.0}
+
+    def take_token(kind, key, now, refund=False):
+        """
+        Spend one attempt from bucket kind:key; returns 0, or seconds until one is
+        available. refund=True gives one back instead (never above capacity).
+        """
+        capacity, per = THROTTLE_RULES[kind]
+        bucket = f"{kind}:{key}"
+        conn = None
+        if app.config["THROTTLE_PERSIST"]:
+            conn = get_db()
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, updated FROM login_throttle WHERE bucket=?", (bucket,)).fetchone()
+            state = (row["tokens"], row["updated"]) if row else None
+        else:
+            state = throttle_buckets.get(bucket)
+
+        tokens, last = state or (capacity, now)
+        tokens = min(capacity, tokens + (now - last) / per)
+        wait = 0 if tokens >= 1 or refund else (1 - tokens) * per
+        if refund:
+            tokens = min(capacity, tokens + 1)
+        elif not wait:
+            tokens -= 1
+
+        if conn is not None:
+            conn.execute("INSERT OR REPLACE INTO login_throttle (bucket, tokens, updated) VALUES (?,?,?)",
+                         (bucket, tokens, now))
+            conn.commit()
+            conn.close()
+        else:
+            if len(throttle_buckets) >= THROTTLE_MAX_BUCKETS:
+                # forget buckets that have refilled completely; they'd start full anyway
+                for k, (t, u) in list(throttle_buckets.items()):
+                    k_capacity, k_per = THROTTLE_RULES[k.split(":", 1)[0]]
+                    if t + (now - u) / k_per >= k_capacity:
+                        del throttle_buckets[k]
+            throttle_buckets[bucket] = (tokens, now)
+        return wait
+
+    def throttle_keys(username):
+        ip = request.remote_addr or "-"
+        keys = [("ip", ip)]
+        if username:
+            user = username.strip().lower()
+            keys += [("client", f"{user}@{ip}"), ("user", user)]
+        return keys
+
+    def login_retry_after(username):
+        """Charge one login attempt to the caller's IP and to username; 0 = go ahead, else seconds to wait."""
+        now = time.time()
+        with throttle_lock:
+            auth_metrics["login_attempts"] += 1
+            for kind, key in throttle_keys(username):
+                wait = take_token(kind, key, now)
+                if wait:
+                    auth_metrics[f"throttled_{kind}"] += 1
+                    return wait
+            return 0
+
+    def login_succeeded(username):
+        """Give back the attempt login_retry_after charged: only failed passwords count."""
+        now = time.time()
+        with throttle_lock:
+            for kind, key in throttle_keys(username):
+                take_token(kind, key, now, refund=True)
+
+    def throttled_response(wait):
+        retry = int(wait) + 1
+        return jsonify({"ok": False, "error": f"Too many attempts, try again in {retry} s"}), 429, {"Retry-After": str(retry)}
+
+    def timed_hash(fn, *args):
+        """Run a werkzeug hash function and account its time in auth_metrics."""
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with throttle_lock:
+                auth_metrics["hash_calls"] += 1
+                auth_metrics["hash_seconds"] += time.perf_counter() - t0
+
+    def password_user(username, password):
+        """The users row for a valid username & password, else None."""
         if not username or not password:
-            return False, None
+            return None
         conn = get_db()
         row = conn.execute("SELECT * FROM users WHERE username=?", (username,)).fetchone()
-        conn.close()
         if not row:
+            conn.close()
+            return None
+        if row["password_hash"] is None:
+            # seeded default account, never logged in yet
+            default_pw = DEFAULT_USERS.get(username, (None,))[0]
+            if default_pw is None or not hmac.compare_digest(password.encode(), default_pw.encode()):
+                conn.close()
+                return None
+            conn.execute("UPDATE users SET password_hash=? WHERE id=? AND password_hash IS NULL",
+                         (timed_hash(generate_password_hash, password), row["id"]))
+            conn.commit()
+            conn.close()
+            login_succeeded(username)
+            return row
+        conn.close()
+        if timed_hash(check_password_hash, row["password_hash"], password):
+            login_succeeded(username)
+            return row
+        return None
+
+    def check_password(username, password):
+        """Validate username & password and return (ok, emp_id)"""
+        row = password_user(username, password)
+        return (True, row["emp_id"]) if row else (False, None)
+
+    def request_token(payload):
+        token = payload.get("token")
+        auth = request.headers.get("Authorization", "")
+        if not token and auth.startswith("Bearer "):
+            token = auth[len("Bearer "):]
+        return token
+
+    def check_credentials(payload, scope=None):
+        """Validate a session token (or username & password) and return (ok, emp_id)"""
+        token = request_token(payload)
+        if token:
+            return verify_token(token, scope)
+        if login_retry_after(payload.get("username")):
             return False, None
-        if check_password_hash(row["password_hash"], password):
-            return True, row["emp_id"]
-        return False, None
+        return check_password(payload.get("username"), payload.get("password"))
+
+    def is_admin_user(username):
+        conn = get_db()
+        row = conn.execute("SELECT is_admin FROM users WHERE username=?", (username,)).fetchone()
+        conn.close()
+        return bool(row and row["is_admin"])
+
+    def check_admin(payload):
+        """
+        Like check_credentials, but only accounts with users.is_admin pass. The
+        flag is set server-side (DEFAULT_ADMINS), so an emp_id a user picked
+        for themselves grants nothing.
+        """
+        token = request_token(payload)
+        if token:
+            data = token_data(token)
+            username = data and data.get("u")
+        else:
+            if login_retry_after(payload.get("username")):
+                return False
+            row = password_user(payload.get("username"), payload.get("password"))
+            username = row and row["username"]
+        return bool(username) and is_admin_user(username)
+
+    # ---------------- Idempotent Requests ----------------
+    REQUEST_LOG_TTL_HOURS = 24
+    # a reservation still without a response after this long belongs to a request
+    # that died (crash, killed worker); the next retry takes it over
+    REQUEST_LEASE_SECONDS = 60
+
+    def replayed_response(row):
+        resp = app.response_class(row["response"], status=row["status_code"], mimetype="application/json")
+        resp.headers["X-Idempotent-Replay"] = "1"
+        return resp
+
+    def idempotent_call(request_id, endpoint, fn):
+        """Run fn() once per (request_id, endpoint); later calls get the stored 2xx response back."""
+        request_id = str(request_id or "").strip()
+        if not request_id:
+            return make_response(fn())
+
+        conn = get_db()
+        conn.execute("DELETE FROM request_log WHERE created_at < datetime('now', ?)",
+                     (f"-{REQUEST_LOG_TTL_HOURS} hours",))
+        # reserve the id first so a concurrent double-submit can't run twice
+        reserved = conn.execute("""
+            INSERT INTO request_log (request_id, endpoint) VALUES (?,?)
+            ON CONFLICT (request_id, endpoint) DO UPDATE SET created_at=CURRENT_TIMESTAMP
+            WHERE status_code IS NULL AND created_at < datetime('now', ?)
+        """, (request_id, endpoint, f"-{REQUEST_LEASE_SECONDS} seconds")).rowcount
+        conn.commit()
+        if not reserved:
+            row = conn.execute("SELECT status_code, response FROM request_log WHERE request_id=? AND endpoint=?",
+                               (request_id, endpoint)).fetchone()
+            conn.close()
+            if row is None or row["status_code"] is None:
+                return make_response(jsonify({"ok": False, "retry": True, "error": "Request already in progress"}), 409)
+            return replayed_response(row)
+
+        try:
+            resp = make_response(fn())
+        except Exception:
+            conn.execute("DELETE FROM request_log WHERE request_id=? AND endpoint=?", (request_id, endpoint))
+            conn.commit()
+            conn.close()
+            raise
+        if 200 <= resp.status_code < 300:
+            conn.execute("UPDATE request_log SET status_code=?, response=? WHERE request_id=? AND endpoint=?",
+                         (resp.status_code, resp.get_data(as_text=True), request_id, endpoint))
+        else:
+            # nothing was applied: the client keeps the request_id until it succeeds,
+            # so a corrected retry (fixed field, re-entered password) must run again
+            conn.execute("DELETE FROM request_log WHERE request_id=? AND endpoint=?", (request_id, endpoint))
+        conn.commit()
+        conn.close()
+        return resp
+
+    def idempotent_tx(request_id, endpoint, fn):
+        """
+        idempotent_call for handlers that write through the connection they are
+        given: fn(conn) -> (body, http_status). The replay check, fn's writes and
+        the stored response are one transaction (BEGIN IMMEDIATE also serialises
+        double-submits), so a crash leaves no reservation behind and a call costs
+        a single commit. Non-2xx results are rolled back and not stored.
+        """
+        request_id = str(request_id or "").strip()
+        conn = get_db()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if request_id:
+                row = conn.execute("""
+                    SELECT status_code, response FROM request_log
+                    WHERE request_id=? AND endpoint=? AND status_code IS NOT NULL
+                """, (request_id, endpoint)).fetchone()
+                if row:
+                    conn.rollback()
+                    return replayed_response(row)
+            body, code = fn(conn)
+            resp = make_response(jsonify(body), code)
+            if not 200 <= code < 300:
+                conn.rollback()
+                return resp
+            if request_id:
+                conn.execute("DELETE FROM request_log WHERE created_at < datetime('now', ?)",
+                             (f"-{REQUEST_LOG_TTL_HOURS} hours",))
+                conn.execute("INSERT OR REPLACE INTO request_log (request_id, endpoint, status_code, response) VALUES (?,?,?,?)",
+                             (request_id, endpoint, code, resp.get_data(as_text=True)))
+            conn.commit()
+            return resp
+        finally:
+            conn.close()
+
+    def idempotent(view):
+        """
+        Replay the stored response when a mutating call is retried with the same
+        request_id (JSON/form field or X-Request-ID header). Calls without a
+        request_id run as before.
+        """
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            payload = request.get_json(silent=True) or request.form.to_dict()
+            request_id = payload.get("request_id") or request.headers.get("X-Request-ID")
+            return idempotent_call(request_id, request.path, lambda: view(*args, **kwargs))
+        return wrapper
+
     # (Keep all your route and API definitions below this point)
     # ---------------- Pages ----------------
     @app.route("/")
@@ -216,13 +1546,28 @@ def create_app():
     @app.route("/api/login", methods=["POST"])
     def api_login():
         payload = request.get_json(silent=True) or request.form.to_dict()
-        ok, emp_id = check_credentials(payload)
-        if ok:
-            return jsonify({"ok": True, "username": payload["username"], "emp_id": emp_id})
+        wait = login_retry_after(payload.get("username"))
+        if wait:
+            return throttled_response(wait)
+        user = password_user(payload.get("username"), payload.get("password"))
+        if user:
+            token, scopes = issue_token(user, payload.get("scopes"))
+            return jsonify({"ok": True, "username": user["username"], "emp_id": user["emp_id"],
+                            "token": token, "scopes": scopes, "expires_in": SESSION_TOKEN_TTL})
         return jsonify({"ok": False, "error": "Invalid username or password"}), 403
     
+    @app.route("/api/auth_metrics")
+    def api_auth_metrics():
+        with throttle_lock:
+            out = dict(auth_metrics)
+            out["tracked_buckets"] = len(throttle_buckets)
+        out["hash_seconds"] = round(out["hash_seconds"], 3)
+        out["avg_hash_ms"] = round(out["hash_seconds"] * 1000 / out["hash_calls"], 1) if out["hash_calls"] else 0
+        return jsonify(out)
+
     # ---------------- CHANGE EMP API ----------------
     @app.route("/api/change_credentials", methods=["POST"])
+    @idempotent
     def api_change_credentials():
         payload = request.get_json(silent=True) or request.form.to_dict()
         username = payload.get("username")
@@ -234,12 +1579,22 @@ def create_app():
         if not username or not old_pw:
             return jsonify({"ok": False, "error": "Username and old password required"}), 400
 
+        wait = login_retry_after(username)
+        if wait:
+            return throttled_response(wait)
+        user = password_user(username, old_pw)
+        if not user:
+            return jsonify({"ok": False, "error": "Invalid username or old password"}), 403
+        # emp_id is who a user acts as in history and ISOS records: only admins may reassign it
+        if new_emp_id and not user["is_admin"]:
+            return jsonify({"ok": False, "error": "Only an admin can change the EMP ID"}), 403
+
         conn = get_db()
         cur = conn.cursor()
-        row = cur.execute("SELECT * FROM users WHERE username=?", (username,)).fetchone()
-        if not row or not check_password_hash(row["password_hash"], old_pw):
+        if new_emp_id and cur.execute("SELECT 1 FROM users WHERE emp_id=? AND username!=?",
+                                      (new_emp_id, username)).fetchone():
             conn.close()
-            return jsonify({"ok": False, "error": "Invalid username or old password"}), 403
+            return jsonify({"ok": False, "error": f"EMP ID {new_emp_id} is already in use"}), 409
 
         updates = []
         values = []
@@ -249,7 +1604,7 @@ def create_app():
             values.append(new_username)
         if new_pw:
             updates.append("password_hash=?")
-            values.append(generate_password_hash(new_pw))
+            values.append(timed_hash(generate_password_hash, new_pw))
         if new_emp_id:   # 👈 allow EMP ID change
             updates.append("emp_id=?")
             values.append(new_emp_id)
@@ -258,6 +1613,7 @@ def create_app():
             conn.close()
             return jsonify({"ok": False, "error": "Nothing to update"}), 400
 
+        updates.append("token_version=token_version+1")   # log out existing sessions
         values.append(username)
         cur.execute(f"UPDATE users SET {', '.join(updates)} WHERE username=?", values)
         conn.commit()
@@ -286,6 +1642,7 @@ def create_app():
     
     # ---------------- CHANGE OPERATOR API ----------------
     @app.route("/api/change_operator", methods=["POST"])
+    @idempotent
     def api_change_operator():
         payload = request.get_json()
         username = payload.get("username")
@@ -350,10 +1707,48 @@ def create_app():
 
     @app.route("/api/status")
     def api_status():
+        ensure_status_fresh()
         conn = get_db()
-        rows = conn.execute("SELECT * FROM stencil_list WHERE condition_status != 'SCRAP' ORDER BY stencil_revalidation_dt ASC").fetchall()
+        derived = request.args.get("derived_status")
+        if derived:
+            rows = conn.execute("""
+                SELECT * FROM stencil_list
+                WHERE derived_status = ? AND condition_status != 'SCRAP'
+                ORDER BY stencil_revalidation_dt ASC
+            """, (derived.upper(),)).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM stencil_list WHERE condition_status != 'SCRAP' ORDER BY stencil_revalidation_dt ASC").fetchall()
         conn.close()
-        return jsonify([row_to_dict(r) for r in rows])
+        return jsonify([row_to_dict(r, ["id"] + ALL_FIELDS + ["derived_status", "status_class"]) for r in rows])
+
+    @app.route("/api/alerts")
+    def api_alerts():
+        """Alerts with counts per severity. ?state=open|resolved|all (default open), ?severity=..., ?limit=0 for counts only."""
+        state = request.args.get("state", "open")
+        severity = request.args.get("severity")
+        limit = max(0, min(request.args.get("limit", 1000, type=int), 1000))
+        where, params = [], []
+        if state == "open":
+            where.append("resolved_at IS NULL")
+        elif state == "resolved":
+            where.append("resolved_at IS NOT NULL")
+        if severity:
+            where.append("severity = ?")
+            params.append(severity.lower())
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+        conn = get_db()
+        counts = {sev: 0 for sev in ("critical", "warning", "info")}
+        for r in conn.execute("SELECT severity, COUNT(*) AS c FROM alerts WHERE resolved_at IS NULL GROUP BY severity"):
+            counts[r["severity"]] = r["c"]
+        rows = conn.execute(f"""
+            SELECT id, asset_id, asset_no, status_class, severity, message, raised_at, resolved_at
+            FROM alerts {where_sql}
+            ORDER BY raised_at DESC, id DESC
+            LIMIT ?
+        """, params + [limit]).fetchall()
+        conn.close()
+        return jsonify({"ok": True, "counts": counts, "alerts": [dict(r) for r in rows]})
 
     # ------- ISOS APIs -------
     @app.route("/api/isos_list")
@@ -385,6 +1780,7 @@ def create_app():
 
     @app.route("/api/isos_lookup/<path:stencil_no>")
     def api_isos_lookup(stencil_no):
+        ensure_status_fresh()
         conn = get_db()
         row = conn.execute("SELECT * FROM stencil_list WHERE stencil_no=?", (stencil_no,)).fetchone()
         if not row:
@@ -392,40 +1788,53 @@ def create_app():
             return jsonify({"ok": False, "error": f"Stencil not found: {stencil_no}"}), 404
         active = conn.execute("SELECT * FROM isos_cycles WHERE stencil_no=? AND cycle_open=1", (stencil_no,)).fetchone()
         conn.close()
-        return jsonify({"ok": True, "stencil": row_to_dict(row), "active_cycle": dict(active) if active else None})
+        stencil = row_to_dict(row, ["id"] + ALL_FIELDS + ["derived_status"])
+        return jsonify({"ok": True, "stencil": stencil, "active_cycle": dict(active) if active else None})
+
+    def scan_time(payload):
+        """UTC timestamp of a queued offline scan ('scanned_at'), or None for CURRENT_TIMESTAMP."""
+        raw = payload.get("scanned_at")
+        if not raw:
+            return None
+        try:
+            ts = datetime.datetime.fromisoformat(str(raw).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if ts.tzinfo is not None:
+            ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return min(ts, now).strftime("%Y-%m-%d %H:%M:%S")
 
     # ---------------- ISOS OUT ----------------
-    @app.route("/api/isos_out", methods=["POST"])
-    def api_isos_out():
-        payload = request.get_json()
+    def isos_out(payload, conn):
+        """Open an ISOS cycle through conn (the caller commits). Returns (body, http_status)."""
         stencil_no = payload.get("stencil_no")
         operator_id = payload.get("operator_id")
 
         if not stencil_no or not operator_id:
-            return jsonify({"ok": False, "error": "Stencil No and Operator ID required"}), 400
+            return {"ok": False, "error": "Stencil No and Operator ID required"}, 400
 
-        conn = get_db()
         # ✅ Validate operator_id exists
         op = conn.execute("SELECT * FROM operators WHERE operator_id=?", (operator_id,)).fetchone()
         if not op:
-            conn.close()
-            return jsonify({"ok": False, "error": "Invalid Operator ID"}), 403
+            return {"ok": False, "error": "Invalid Operator ID"}, 403
 
         # Check stencil
         row = conn.execute("SELECT * FROM stencil_list WHERE stencil_no=?", (stencil_no,)).fetchone()
         if not row:
-            conn.close()
-            return jsonify({"ok": False, "error": "Stencil not found"}), 404
+            return {"ok": False, "error": "Stencil not found"}, 404
 
         if is_stencil_blocked(row["condition_status"]):
-            conn.close()
-            return jsonify({"ok": False, "error": f"Stencil cannot be used (condition_status: {row['condition_status']})"}), 400
+            return {"ok": False, "error": f"Stencil cannot be used (condition_status: {row['condition_status']})"}, 400
+
+        # revalidation / tension state only stops a stencil going OUT; returning it stays allowed
+        if is_stencil_blocked(row["derived_status"]):
+            return {"ok": False, "error": f"Stencil cannot be used (status: {row['derived_status']})"}, 400
 
         # Ensure not already OUT
         active = conn.execute("SELECT * FROM isos_cycles WHERE stencil_no=? AND cycle_open=1", (stencil_no,)).fetchone()
         if active:
-            conn.close()
-            return jsonify({"ok": False, "error": "Stencil already OUT, must scan IN first"}), 400
+            return {"ok": False, "conflict": True, "error": "Stencil already OUT, must scan IN first"}, 400
 
         # Status calc
         cleaned_ok = payload.get("cleaned_ok")
@@ -442,44 +1851,43 @@ def create_app():
                 cleaned_ok, dent_ok, mesh_ok,
                 tension_a, tension_b, tension_c, tension_d, tension_e,
                 operator_id, status, cycle_open
-            ) VALUES (?, CURRENT_TIMESTAMP, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
-        """, (stencil_no, remarks, cleaned_ok, dent_ok, mesh_ok, *tensions, operator_id, status))
+            ) VALUES (?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+        """, (stencil_no, scan_time(payload), remarks, cleaned_ok, dent_ok, mesh_ok, *tensions, operator_id, status))
 
         conn.execute("UPDATE stencil_list SET production_status=? WHERE stencil_no=?", (status, stencil_no))
-        conn.commit()
-        conn.close()
-        return jsonify({"ok": True, "status": status})
+        return {"ok": True, "status": status}, 200
+
+    @app.route("/api/isos_out", methods=["POST"])
+    def api_isos_out():
+        payload = request.get_json(silent=True) or {}
+        ensure_status_fresh()
+        return idempotent_tx(payload.get("request_id") or request.headers.get("X-Request-ID"), request.path,
+                             lambda conn: isos_out(payload, conn))
 
     # ---------------- ISOS IN ----------------
-    @app.route("/api/isos_in", methods=["POST"])
-    def api_isos_in():
-        payload = request.get_json()
+    def isos_in(payload, conn):
+        """Close the open ISOS cycle through conn (the caller commits). Returns (body, http_status)."""
         stencil_no = payload.get("stencil_no")
         operator_id = payload.get("operator_id")
 
         if not stencil_no or not operator_id:
-            return jsonify({"ok": False, "error": "Stencil No and Operator ID required"}), 400
+            return {"ok": False, "error": "Stencil No and Operator ID required"}, 400
 
-        conn = get_db()
         # ✅ Validate operator_id exists
         op = conn.execute("SELECT * FROM operators WHERE operator_id=?", (operator_id,)).fetchone()
         if not op:
-            conn.close()
-            return jsonify({"ok": False, "error": "Invalid Operator ID"}), 403
+            return {"ok": False, "error": "Invalid Operator ID"}, 403
 
         row = conn.execute("SELECT * FROM stencil_list WHERE stencil_no=?", (stencil_no,)).fetchone()
         if not row:
-            conn.close()
-            return jsonify({"ok": False, "error": "Stencil not found"}), 404
+            return {"ok": False, "error": "Stencil not found"}, 404
 
         if is_stencil_blocked(row["condition_status"]):
-            conn.close()
-            return jsonify({"ok": False, "error": f"Stencil cannot be returned (condition_status: {row['condition_status']})"}), 400
+            return {"ok": False, "error": f"Stencil cannot be returned (condition_status: {row['condition_status']})"}, 400
 
         active = conn.execute("SELECT * FROM isos_cycles WHERE stencil_no=? AND cycle_open=1", (stencil_no,)).fetchone()
         if not active:
-            conn.close()
-            return jsonify({"ok": False, "error": "No active OUT cycle for this stencil"}), 400
+            return {"ok": False, "conflict": True, "error": "No active OUT cycle for this stencil"}, 400
 
         # Status calc
         cleaned_ok = payload.get("cleaned_ok")
@@ -491,17 +1899,46 @@ def create_app():
         # Update IN cycle
         conn.execute("""
             UPDATE isos_cycles
-            SET in_time=CURRENT_TIMESTAMP,
+            SET in_time=COALESCE(?, CURRENT_TIMESTAMP),
                 cleaned_ok=?, dent_ok=?, mesh_ok=?,
                 tension_a=?, tension_b=?, tension_c=?, tension_d=?, tension_e=?,
                 operator_id=?, status=?, cycle_open=0
             WHERE id=?
-        """, (cleaned_ok, dent_ok, mesh_ok, *tensions, operator_id, status, active["id"]))
+        """, (scan_time(payload), cleaned_ok, dent_ok, mesh_ok, *tensions, operator_id, status, active["id"]))
 
         conn.execute("UPDATE stencil_list SET production_status=? WHERE stencil_no=?", (status, stencil_no))
-        conn.commit()
-        conn.close()
-        return jsonify({"ok": True, "status": status})
+        return {"ok": True, "status": status}, 200
+
+    @app.route("/api/isos_in", methods=["POST"])
+    def api_isos_in():
+        payload = request.get_json(silent=True) or {}
+        return idempotent_tx(payload.get("request_id") or request.headers.get("X-Request-ID"), request.path,
+                             lambda conn: isos_in(payload, conn))
+
+    # ---------------- ISOS BATCH (offline queue replay) ----------------
+    ISOS_HANDLERS = {"OUT": isos_out, "IN": isos_in}
+
+    @app.route("/api/isos_batch", methods=["POST"])
+    def api_isos_batch():
+        """
+        Replay scans queued by the ISOS page while offline, in order:
+        {"scans": [{"action": "OUT"|"IN", "request_id": ..., "scanned_at": ..., ...}]}.
+        Each scan is idempotent on its request_id, exactly like /api/isos_out and /api/isos_in.
+        """
+        payload = request.get_json(silent=True) or {}
+        results = []
+        ensure_status_fresh()
+        for item in payload.get("scans") or []:
+            action = str(item.get("action", "")).upper()
+            handler = ISOS_HANDLERS.get(action)
+            if handler is None:
+                results.append({"ok": False, "error": f"Invalid action: {action}"})
+                continue
+
+            resp = idempotent_tx(item.get("request_id"), f"/api/isos_{action.lower()}",
+                                 lambda conn, handler=handler, item=item: handler(item, conn))
+            results.append({**resp.get_json(), "request_id": item.get("request_id")})
+        return jsonify({"ok": True, "results": results})
 
     # ------------- Standard CRUD / action APIs -------------
     @app.route("/api/get/<int:stencil_id>")
@@ -511,32 +1948,39 @@ def create_app():
         conn.close()
         if not row:
             abort(404)
-        return jsonify(row_to_dict(row, ["id"] + ALL_FIELDS))
+        return jsonify(row_to_dict(row, ["id"] + ALL_FIELDS + ["row_version"]))
 
     @app.route("/api/add", methods=["POST"])
+    @idempotent
     def api_add():
         payload = request.get_json(silent=True) or request.form.to_dict()
-        ok, emp_id = check_credentials(payload)
+        ok, emp_id = check_credentials(payload, "add")
         if not ok:
             return jsonify({"ok": False, "error": "Unauthorized"}), 403
 
-        data = to_upper({k: payload.get(k) for k in ALL_FIELDS})
+        data = clean_fields({k: payload.get(k) for k in ALL_FIELDS})
         data["emp_id"] = emp_id
+        data["stencil_no"] = data["stencil_no"] or None
         conn = get_db()
         cur = conn.cursor()
-        cur.execute(f"""
-            INSERT INTO stencil_list ({', '.join(ALL_FIELDS)})
-            VALUES ({', '.join(['?'] * len(ALL_FIELDS))})
-        """, [data.get(k) for k in ALL_FIELDS])
+        try:
+            cur.execute(f"""
+                INSERT INTO stencil_list ({', '.join(ALL_FIELDS)})
+                VALUES ({', '.join(['?'] * len(ALL_FIELDS))})
+            """, [data.get(k) for k in ALL_FIELDS])
+        except sqlite3.IntegrityError:
+            conn.close()
+            return jsonify({"ok": False, "error": f"Stencil No already exists: {data['stencil_no']}"}), 409
         new_id = cur.lastrowid
         conn.commit()
         conn.close()
         return jsonify({"ok": True, "id": new_id})
 
     @app.route("/api/update/<int:stencil_id>", methods=["POST"])
+    @idempotent
     def api_update(stencil_id):
         payload = request.get_json(silent=True) or request.form.to_dict()
-        ok, emp_id = check_credentials(payload)
+        ok, emp_id = check_credentials(payload, "update")
         if not ok:
             return jsonify({"ok": False, "error": "Unauthorized"}), 403
 
@@ -547,32 +1991,88 @@ def create_app():
             conn.close()
             abort(404)
 
-        new_data = to_upper({k: payload.get(k) for k in ALL_FIELDS})
+        new_data = clean_fields({k: payload.get(k) for k in ALL_FIELDS})
         new_data["emp_id"] = emp_id
-        changes = []
-        for f in ALL_FIELDS:
-            old_val = (old[f] or "").strip()
-            new_val = (new_data.get(f) or "").strip()
-            if old_val != new_val:
-                changes.append((stencil_id, f, old_val, new_val))
+        new_data["stencil_no"] = new_data["stencil_no"] or None
+        changes = {f: new_data.get(f) for f in ALL_FIELDS
+                   if (old[f] or "").strip() != (new_data.get(f) or "").strip()}
 
-        if changes:
-            cur.executemany("""
-                INSERT INTO stencil_history (stencil_id, changed_column, old_value, new_value)
-                VALUES (?,?,?,?)
-            """, changes)
-            set_clause = ", ".join([f"{f}=?" for f in ALL_FIELDS]) + ", updated_at=CURRENT_TIMESTAMP"
-            values = [new_data.get(f) for f in ALL_FIELDS] + [stencil_id]
-            cur.execute(f"UPDATE stencil_list SET {set_clause} WHERE id=?", values)
+        try:
+            update_stencil_fields(conn, stencil_id, changes)
+        except sqlite3.IntegrityError:
+            conn.close()
+            return jsonify({"ok": False, "error": f"Stencil No already exists: {new_data['stencil_no']}"}), 409
 
         conn.commit()
         conn.close()
         return jsonify({"ok": True, "changes": len(changes)})
 
+    @app.route("/api/stencil/<int:stencil_id>", methods=["PATCH"])
+    @idempotent
+    def api_patch(stencil_id):
+        """
+        Partial update: {"version": n, "fields": {column: value, ...}}.
+        Only the sent columns are written; a stale version gets 409 with the current row.
+        """
+        payload = request.get_json(silent=True) or {}
+        ok, emp_id = check_credentials(payload, "update")
+        if not ok:
+            return jsonify({"ok": False, "error": "Unauthorized"}), 403
+
+        fields = payload.get("fields") or {}
+        try:
+            version = int(payload.get("version"))
+        except (TypeError, ValueError):
+            return jsonify({"ok": False, "error": "version is required"}), 400
+        if not isinstance(fields, dict) or not fields:
+            return jsonify({"ok": False, "error": "No fields to update"}), 400
+        unknown = sorted(set(fields) - set(ALL_FIELDS))
+        if unknown:
+            return jsonify({"ok": False, "error": f"Unknown fields: {', '.join(unknown)}"}), 400
+
+        fields = clean_fields(fields)
+        if "stencil_no" in fields:
+            fields["stencil_no"] = fields["stencil_no"] or None
+
+        conn = get_db()
+        row = conn.execute("SELECT * FROM stencil_list WHERE id=?", (stencil_id,)).fetchone()
+        if not row:
+            conn.close()
+            abort(404)
+        # only the sent fields that differ from the stored row are written and reported
+        changed = {f: v for f, v in fields.items() if (row[f] or "").strip() != (v or "").strip()}
+        touched = 0
+        if row["row_version"] == version:
+            if not changed:
+                conn.close()
+                return jsonify({"ok": True, "version": version, "changes": 0, "changed": []})
+            try:
+                touched = update_stencil_fields(conn, stencil_id, {**changed, "emp_id": emp_id}, version)
+            except sqlite3.IntegrityError:
+                conn.close()
+                return jsonify({"ok": False, "error": f"Stencil No already exists: {fields['stencil_no']}"}), 409
+
+        if not touched:
+            row = conn.execute("SELECT * FROM stencil_list WHERE id=?", (stencil_id,)).fetchone()
+            conn.close()
+            if not row:
+                abort(404)
+            return jsonify({
+                "ok": False, "conflict": True,
+                "error": "This stencil was changed by someone else. Reload and try again.",
+                "version": row["row_version"],
+                "current": row_to_dict(row, ["id"] + ALL_FIELDS + ["row_version"]),
+            }), 409
+
+        conn.commit()
+        conn.close()
+        return jsonify({"ok": True, "version": version + 1, "changes": len(changed), "changed": sorted(changed)})
+
     @app.route("/api/action/<int:stencil_id>", methods=["POST"])
+    @idempotent
     def api_action(stencil_id):
         payload = request.get_json(silent=True) or request.form.to_dict()
-        ok, emp_id = check_credentials(payload)
+        ok, emp_id = check_credentials(payload, "action")
         if not ok:
             return jsonify({"ok": False, "error": "Unauthorized"}), 403
 
@@ -584,55 +2084,407 @@ def create_app():
             abort(400, "Invalid action")
 
         conn = get_db()
-        cur = conn.cursor()
         # set condition_status for these actions; production_status left untouched
-        cur.execute("""
-            UPDATE stencil_list
-            SET condition_status=?, emp_id=?, remarks=?, updated_at=CURRENT_TIMESTAMP
-            WHERE id=?
-        """, (action, emp, remarks, stencil_id))
+        update_stencil_fields(conn, stencil_id, {"condition_status": action, "emp_id": emp, "remarks": remarks})
         conn.commit()
         conn.close()
         return jsonify({"ok": True, "action": action})
 
+    # ------------- Bulk edit / action -------------
+    def bulk_selector(payload):
+        """
+        Rows to touch: {"ids": [1, 2, ...]} or {"filter": {column: value | [values]}}.
+        Returns (where, params, error).
+        """
+        ids = payload.get("ids")
+        flt = payload.get("filter")
+        if ids:
+            if not isinstance(ids, list) or not all(str(i).isdigit() for i in ids):
+                return None, None, "ids must be a list of stencil ids"
+            return "id IN (SELECT value FROM json_each(?))", [json.dumps([int(i) for i in ids])], None
+        if flt:
+            if not isinstance(flt, dict):
+                return None, None, "filter must be an object"
+            unknown = sorted(set(flt) - set(ALL_FIELDS))
+            if unknown:
+                return None, None, f"Unknown filter fields: {', '.join(unknown)}"
+            clauses, params = [], []
+            for col, val in flt.items():
+                if isinstance(val, list):
+                    clauses.append(f"IFNULL({col}, '') IN (SELECT value FROM json_each(?))")
+                    params.append(json.dumps([to_upper({"v": v})["v"] for v in val]))
+                else:
+                    clauses.append(f"IFNULL({col}, '') = ?")
+                    params.append(to_upper({"v": val})["v"])
+            return " AND ".join(clauses), params, None
+        return None, None, "Give ids or a filter"
+
+    def bulk_apply(payload, fields):
+        """Shared body of the bulk endpoints: one connection, one UPDATE, one commit."""
+        where, params, error = bulk_selector(payload)
+        if error:
+            return jsonify({"ok": False, "error": error}), 400
+        t0 = time.perf_counter()
+        conn = get_db()
+        try:
+            updated = update_stencils_where(conn, where, params, fields)
+        except sqlite3.IntegrityError as e:
+            conn.rollback()
+            conn.close()
+            return jsonify({"ok": False, "error": str(e)}), 409
+        conn.commit()
+        conn.close()
+        return jsonify({"ok": True, "updated": updated,
+                        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1)})
+
+    @app.route("/api/bulk_update", methods=["POST"])
+    @idempotent
+    def api_bulk_update():
+        """Set the same field values on many stencils, e.g. a rack move: {"ids": [...], "fields": {"location": "B2"}}."""
+        payload = request.get_json(silent=True) or {}
+        ok, emp_id = check_credentials(payload, "update")
+        if not ok:
+            return jsonify({"ok": False, "error": "Unauthorized"}), 403
+
+        fields = payload.get("fields") or {}
+        if not isinstance(fields, dict) or not fields:
+            return jsonify({"ok": False, "error": "No fields to update"}), 400
+        unknown = sorted(set(fields) - set(ALL_FIELDS))
+        if unknown:
+            return jsonify({"ok": False, "error": f"Unknown fields: {', '.join(unknown)}"}), 400
+        if "stencil_no" in fields:
+            return jsonify({"ok": False, "error": "stencil_no is unique and can't be bulk edited"}), 400
+
+        fields = clean_fields(fields)
+        fields["emp_id"] = emp_id
+        return bulk_apply(payload, fields)
+
+    @app.route("/api/bulk_action", methods=["POST"])
+    @idempotent
+    def api_bulk_action():
+        """MOVE / REWORK / SCRAP a list of stencils or every stencil matching a filter."""
+        payload = request.get_json(silent=True) or {}
+        ok, emp_id = check_credentials(payload, "action")
+        if not ok:
+            return jsonify({"ok": False, "error": "Unauthorized"}), 403
+
+        action = (payload.get("action") or "").upper()
+        if action not in ["MOVE", "REWORK", "SCRAP"]:
+            return jsonify({"ok": False, "error": "Invalid action"}), 400
+        return bulk_apply(payload, {"condition_status": action,
+                                    "emp_id": payload.get("emp_id") or emp_id,
+                                    "remarks": payload.get("remarks", "")})
+
     @app.route("/api/delete/<int:stencil_id>", methods=["POST"])
+    @idempotent
     def api_delete(stencil_id):
         payload = request.get_json(silent=True) or request.form.to_dict()
-        ok, emp_id = check_credentials(payload)
+        ok, emp_id = check_credentials(payload, "delete")
         if not ok:
             return jsonify({"ok": False, "error": "Unauthorized"}), 403
         conn = get_db()
         cur = conn.cursor()
         cur.execute("DELETE FROM stencil_list WHERE id=?", (stencil_id,))
         cur.execute("DELETE FROM stencil_history WHERE stencil_id=?", (stencil_id,))
+        cur.execute("DELETE FROM stencil_snapshot_rows WHERE stencil_id=?", (stencil_id,))
         conn.commit()
         conn.close()
         return jsonify({"ok": True})
 
+    HISTORY_PAGE_SIZE = 50
+    HISTORY_MAX_PAGE = 500
+
+    def history_filters(stencil_id, args):
+        """
+        WHERE clause for ?column=a,b (or "all"), ?from= and ?to= (date or ISO datetime;
+        a bare "to" date includes that whole day). Raises ValueError on bad input.
+        """
+        where, params = ["stencil_id = ?"], [stencil_id]
+        columns = [c.strip() for c in (args.get("column") or "").split(",") if c.strip() and c.strip() != "all"]
+        if columns:
+            where.append(f"changed_column IN ({', '.join('?' * len(columns))})")
+            params += columns
+        if args.get("from"):
+            where.append("changed_at >= ?")
+            params.append(parse_as_of(args["from"], day_end=False))
+        if args.get("to"):
+            where.append("changed_at <= ?")
+            params.append(parse_as_of(args["to"]))
+        return " AND ".join(where), params
+
     @app.route("/api/history/<int:stencil_id>")
     def api_history(stencil_id):
-        column = request.args.get("column")
+        """
+        Newest-first history page. Pass the returned next_cursor as ?cursor= for the
+        next page (keyset on changed_at, id - no OFFSET scans).
+        """
+        try:
+            where, params = history_filters(stencil_id, request.args)
+        except ValueError:
+            return jsonify({"ok": False, "error": "from/to must be YYYY-MM-DD or an ISO datetime"}), 400
+        limit = min(max(request.args.get("limit", HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE)
+        cursor = request.args.get("cursor")
+        if cursor:
+            changed_key, _, last_id = cursor.rpartition("|")
+            if not last_id.isdigit():
+                return jsonify({"ok": False, "error": "Invalid cursor"}), 400
+            where += " AND (changed_at, id) < (?, ?)"
+            params += [changed_key, int(last_id)]
+
         conn = get_db()
-        cur = conn.cursor()
-        if column and column != "all":
-            cur.execute("""
-                SELECT changed_at, changed_column, old_value, new_value
-                FROM stencil_history
-                WHERE stencil_id = ? AND changed_column = ?
-                ORDER BY changed_at DESC, id DESC
-            """, (stencil_id, column))
-        else:
-            cur.execute("""
-                SELECT changed_at, changed_column, old_value, new_value
-                FROM stencil_history
-                WHERE stencil_id = ?
-                ORDER BY changed_at DESC, id DESC
-            """, (stencil_id,))
-        rows = [dict(r) for r in cur.fetchall()]
+        rows = conn.execute(f"""
+            SELECT id, changed_at, CAST(changed_at AS TEXT) AS changed_key,
+                   changed_column, old_value, new_value
+            FROM stencil_history
+            WHERE {where}
+            ORDER BY changed_at DESC, id DESC
+            LIMIT ?
+        """, params + [limit + 1]).fetchall()
         conn.close()
-        return jsonify(rows)
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['changed_key']}|{rows[-1]['id']}" if more else None
+        items = [{k: r[k] for k in ("changed_at", "changed_column", "old_value", "new_value")} for r in rows]
+        return jsonify({"ok": True, "rows": items, "next_cursor": next_cursor})
+
+    @app.route("/api/history/<int:stencil_id>/count")
+    def api_history_count(stencil_id):
+        """Number of history rows matching the same filters as /api/history."""
+        try:
+            where, params = history_filters(stencil_id, request.args)
+        except ValueError:
+            return jsonify({"ok": False, "error": "from/to must be YYYY-MM-DD or an ISO datetime"}), 400
+        conn = get_db()
+        count = conn.execute(f"SELECT COUNT(*) AS c FROM stencil_history WHERE {where}", params).fetchone()["c"]
+        conn.close()
+        return jsonify({"ok": True, "count": count})
+
+    @app.route("/api/as_of")
+    def api_as_of():
+        """Stencil(s) as they were at ?at=<date|datetime>, optionally one ?stencil_id=."""
+        try:
+            at = parse_as_of(request.args.get("at"))
+        except ValueError:
+            return jsonify({"ok": False, "error": "at must be YYYY-MM-DD or an ISO datetime"}), 400
+        stencil_id = request.args.get("stencil_id", type=int)
+        conn = get_db()
+        rows, source = stencils_as_of(conn, at, stencil_id)
+        conn.close()
+        if stencil_id is not None and not rows:
+            abort(404)
+        return jsonify({"ok": True, "at": at, "source": source, "count": len(rows), "rows": rows})
+
+    # ------------- Excel Export -------------
+    EXPORT_PAGE_ROWS = 2000  # rows per read: each SELECT is short, so scans never wait on a long export
+    EXPORT_DATE_FIELDS = {"date_received", "stencil_validation_dt", "stencil_revalidation_dt", "out_time", "in_time"}
+    EXPORT_SHEETS = {
+        # key: (sheet title, columns, FROM ... WHERE, sort key, descending) - same sheets as the old browser export
+        "home": ("Home", [f"s.{c}" for c in ["id"] + SHORT_FIELDS + ["condition_status", "production_status"]],
+                 "stencil_list s WHERE s.condition_status != 'SCRAP'", ["IFNULL(s.updated_at, '')", "s.id"], True),
+        "received": ("Received List", [f"s.{c}" for c in [
+                         "id", "fg", "side", "customer", "stencil_no", "rack_no", "location",
+                         "stencil_mils", "stencil_mils_usl", "stencil_mils_lsl", "stencil_supplier",
+                         "stencil_pr_no", "date_received", "stencil_validation_dt", "stencil_revalidation_dt",
+                         "tension_a", "tension_b", "tension_c", "tension_d", "tension_e",
+                         "received_by", "condition_status", "production_status", "remarks", "emp_id"]],
+                     "stencil_list s WHERE 1", ["IFNULL(s.updated_at, '')", "s.id"], True),
+        "status": ("Status", [f"s.{c}" for c in [
+                       "fg", "side", "customer", "stencil_no", "rack_no", "location",
+                       "stencil_validation_dt", "stencil_revalidation_dt",
+                       "tension_a", "tension_b", "tension_c", "tension_d", "tension_e",
+                       "remarks", "condition_status", "production_status", "emp_id"]],
+                   "stencil_list s WHERE s.condition_status != 'SCRAP'",
+                   ["IFNULL(s.stencil_revalidation_dt, '')", "s.id"], False),
+        "isos": ("ISOS", ["i.stencil_no", "s.fg", "s.customer", "s.rack_no", "s.location",
+                          "i.out_time", "i.in_time", "i.remarks", "i.status", "i.operator_id"],
+                 "isos_cycles i JOIN stencil_list s ON i.stencil_no = s.stencil_no WHERE 1",
+                 ["IFNULL(i.out_time, '')", "i.id"], True),
+    }
+
+    def export_rows(conn, sheet, where, params):
+        """
+        A sheet's rows in EXPORT_PAGE_ROWS pages, keyset-paged on its sort key, so
+        no read statement stays open (holding the database lock) while the
+        workbook is being written.
+        """
+        _, cols, source, keys, desc = EXPORT_SHEETS[sheet]
+        op, direction = ("<", "DESC") if desc else (">", "ASC")
+        order = ", ".join(f"{k} {direction}" for k in keys)
+        last = None
+        while True:
+            clauses, args = list(where), list(params)
+            if last is not None:
+                clauses.append(f"({', '.join(keys)}) {op} ({', '.join('?' * len(keys))})")
+                args += last
+            rows = conn.execute(f"""
+                SELECT {', '.join(cols)}, {', '.join(keys)} FROM {source}
+                {''.join(' AND ' + c for c in clauses)}
+                ORDER BY {order} LIMIT ?
+            """, args + [EXPORT_PAGE_ROWS]).fetchall()
+            for r in rows:
+                yield tuple(r)[:len(cols)]
+            if len(rows) < EXPORT_PAGE_ROWS:
+                return
+            last = list(tuple(rows[-1])[len(cols):])
+
+    def excel_datetime(value):
+        """dd/mm/yyyy h:mm AM/PM like the old browser export; unparseable values as they are."""
+        if not value:
+            return ""
+        try:
+            d = datetime.datetime.fromisoformat(str(value))
+        except ValueError:
+            return value
+        return f"{d:%d/%m/%Y} {d.hour % 12 or 12}:{d:%M} {'PM' if d.hour >= 12 else 'AM'}"
+
+    @app.route("/api/export.xlsx")
+    def api_export_xlsx():
+        """
+        The Excel download, built server-side with openpyxl's write-only
+        (constant memory) workbook from paged cursors. ?sheets=home,received,status,isos
+        (default all); stencil fields filter every sheet (?customer=X, repeatable),
+        as does ?derived_status=; ?from=/?to= (YYYY-MM-DD) limit ISOS out_time.
+        """
+        allowed = set(ALL_FIELDS) | {"sheets", "derived_status", "from", "to"}
+        unknown = sorted(set(request.args) - allowed)
+        sheets = [k for k in request.args.get("sheets", ",".join(EXPORT_SHEETS)).split(",") if k]
+        unknown += [f"sheets={k}" for k in sheets if k not in EXPORT_SHEETS]
+        if unknown:
+            return jsonify({"ok": False, "error": f"Unknown export parameters: {', '.join(unknown)}"}), 400
+
+        stencil_where, stencil_params = [], []
+        flt = {f: request.args.getlist(f) for f in ALL_FIELDS if f in request.args}
+        if flt:
+            clause, params, _ = bulk_selector({"filter": flt})
+            stencil_where.append(clause)
+            stencil_params += params
+        derived = request.args.get("derived_status")
+        if derived:
+            stencil_where.append("derived_status = ?")
+            stencil_params.append(derived.upper())
+        where = [f"s.id IN (SELECT id FROM stencil_list WHERE {' AND '.join(stencil_where)})"] if stencil_where else []
+        isos_where, isos_params = [], []
+        if request.args.get("from"):
+            isos_where.append("i.out_time >= ?")
+            isos_params.append(request.args["from"])
+        if request.args.get("to"):
+            isos_where.append("i.out_time < date(?, '+1 day')")
+            isos_params.append(request.args["to"])
+
+        # only needed for exports, so openpyxl does not load at startup
+        import openpyxl
+        from openpyxl.utils import get_column_letter
+
+        if "status" in sheets or derived:
+            ensure_status_fresh()
+        t0 = time.perf_counter()
+        wb = openpyxl.Workbook(write_only=True)
+        total = 0
+        conn = get_db()
+        try:
+            for key in sheets:
+                title, cols = EXPORT_SHEETS[key][:2]
+                names = [c.split(".")[-1] for c in cols]
+                dates = [n in EXPORT_DATE_FIELDS for n in names]
+                ws = wb.create_sheet(title)
+                for i, (name, is_date) in enumerate(zip(names, dates), 1):
+                    ws.column_dimensions[get_column_letter(i)].width = 20 if is_date else max(len(name) + 2, 12)
+                ws.append([n.upper() for n in names])
+                extra_where, extra_params = (isos_where, isos_params) if key == "isos" else ([], [])
+                for row in export_rows(conn, key, where + extra_where, stencil_params + extra_params):
+                    # None leaves the cell out entirely (blank in Excel), which is much cheaper to write than ""
+                    ws.append([(excel_datetime(v) or None) if d else v for v, d in zip(row, dates)])
+                    total += 1
+                ws.append(["Stencil Master List"])
+        finally:
+            conn.close()
+
+        # write-only sheets are already on disk; the zip goes to a temp file that is streamed back
+        out = tempfile.TemporaryFile()
+        wb.save(out)
+        out.seek(0)
+        print(f"📤 Excel export: {total} rows in {time.perf_counter() - t0:.2f}s")
+        return send_file(out, mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                         as_attachment=True, download_name="Stencil_Data.xlsx")
+
+    # ------------- Backups -------------
+    @app.route("/api/backups")
+    def api_backups():
+        entries = sorted(load_backup_catalog(), key=lambda e: e["created_at"], reverse=True)
+        state = load_backup_state()
+        schedule = {
+            "interval_hours": BACKUP_INTERVAL / 3600,
+            "last_run": state.get("last_run"),
+            "last_kind": state.get("last_kind"),
+            "last_error": state.get("last_error"),
+            "next_run": next_backup_run(state).isoformat(timespec="seconds"),
+            "running": backup_running(),
+        }
+        return jsonify({"ok": True, "retention": BACKUP_RETENTION, "schedule": schedule,
+                        "total_size": sum(e["size"] for e in entries), "backups": entries})
+
+    @app.route("/api/backups/run", methods=["POST"])
+    def api_backup_run():
+        """Admin: take a backup now ({"kind": "full" | "incremental"}, default as scheduled)."""
+        payload = request.get_json(silent=True) or request.form.to_dict()
+        if not check_admin(payload):
+            return jsonify({"ok": False, "error": "Unauthorized"}), 403
+        kind = payload.get("kind") or None
+        if kind not in (None, "full", "incremental"):
+            return jsonify({"ok": False, "error": "kind must be full or incremental"}), 400
+        if backup_running():
+            return jsonify({"ok": False, "error": "A backup is already running"}), 409
+        entry = backup_db(kind)
+        if entry is None and backup_running():
+            return jsonify({"ok": False, "error": "A backup is already running"}), 409
+        if entry is None:
+            return jsonify({"ok": False, "error": "Backup failed, see last_error in /api/backups"}), 500
+        return jsonify({"ok": True, "backup": entry,
+                        "next_run": next_backup_run().isoformat(timespec="seconds")})
+
+    @app.route("/api/backups/restore", methods=["POST"])
+    def api_backup_restore():
+        payload = request.get_json(silent=True) or request.form.to_dict()
+        if not check_admin(payload):
+            return jsonify({"ok": False, "error": "Unauthorized"}), 403
+        ok, message = restore_backup(payload.get("file") or "")
+        return jsonify({"ok": ok, "message" if ok else "error": message}), 200 if ok else 400
+
+    # ------------- Master Sheet Import -------------
+    @app.route("/api/import", methods=["POST"])
+    def api_import():
+        """
+        Admin: multipart upload of a master sheet (field "file", .xlsx/.xls/.csv,
+        optional dry_run=1). Answers 202 at once; poll /api/jobs/<id> for progress.
+        """
+        payload = request.form.to_dict()
+        if not check_admin(payload):
+            return jsonify({"ok": False, "error": "Unauthorized"}), 403
+        upload = request.files.get("file")
+        if upload is None or not upload.filename:
+            return jsonify({"ok": False, "error": "No file uploaded"}), 400
+        if os.path.splitext(upload.filename)[1].lower() not in IMPORT_EXTENSIONS:
+            return jsonify({"ok": False, "error": f"File must be one of {', '.join(IMPORT_EXTENSIONS)}"}), 400
+        dry_run = str(payload.get("dry_run", "")).lower() in ("1", "true", "yes", "on")
+        job = start_import_job(upload, dry_run)
+        return jsonify({"ok": True, "job": job["id"], "status_url": f"/api/jobs/{job['id']}"}), 202
+
+    @app.route("/api/jobs/<job_id>")
+    def api_job(job_id):
+        with import_jobs_lock:
+            job = dict(import_jobs.get(job_id) or {})
+        if not job:
+            abort(404)
+        return jsonify({"ok": True, "job": job})
     # ✅ Copy all the route definitions exactly as they are from your current file.
+    mark_phase("routes")
 
+    timings = {name: round((t - prev) * 1000, 1)
+               for (_, prev), (name, t) in zip(phase_marks, phase_marks[1:])}
+    app.config["STARTUP_TIMINGS_MS"] = timings
+    print("⏱ create_app: " + ", ".join(f"{k} {v} ms" for k, v in timings.items())
+          + f" (total {round((phase_marks[-1][1] - phase_marks[0][1]) * 1000, 1)} ms)")
     return app
 
 # ==============================================================
@@ -90,7 +90,8 @@ function promptAuth() {
       }
 
       cleanup();
-      resolve({ username, password });
+      // keep the signed session token, not the password
+      resolve({ username, token: out.token });
     }
 
     function cleanup() {
@@ -142,7 +143,7 @@ function ensureChangeCredsModal() {
             <input name="new_password" class="form-control" type="password">
           </div>
           <div class="mb-2">
-            <label class="form-label">New EMP ID (optional)</label>
+            <label class="form-label">New EMP ID (optional, admin only)</label>
             <input name="new_emp_id" class="form-control">
           </div>
         </div>
@@ -261,6 +262,14 @@ const toUpperObj = (obj) => {
   return out;
 };
 
+// One id per logical submission: retries and double-clicks reuse it, so the
+// server replays the first result instead of applying the change twice.
+function newRequestId() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  const bytes = crypto.getRandomValues(new Uint8Array(16));
+  return Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+}
+
 function formToObj(form) {
   const data = new FormData(form);
   const obj = {};
@@ -330,7 +339,8 @@ $(async function(){
       document.getElementById('stencilForm').reset();
       const form = document.getElementById('stencilForm');
       form.dataset.authUsername = creds.username;
-      form.dataset.authPassword = creds.password;
+      form.dataset.authToken = creds.token;
+      form.dataset.requestId = newRequestId();
       modal.show();
     });
 
@@ -343,32 +353,81 @@ $(async function(){
       $('#modalTitle').text(`Edit Stencil #${editModeId}`);
       const res = await fetch(`/api/get/${editModeId}`);
       const data = await res.json();
-      for (const [k,v] of Object.entries(data)) {
-        const el = document.querySelector(`#stencilForm [name="${k}"]`);
-        if (el) el.value = v || '';
-      }
       const form = document.getElementById('stencilForm');
+      fillEditForm(form, data);
       form.dataset.authUsername = creds.username;
-      form.dataset.authPassword = creds.password;
+      form.dataset.authToken = creds.token;
+      form.dataset.requestId = newRequestId();
       modal.show();
     });
 
+    // keep the loaded values + row_version so Save can PATCH only what changed
+    function fillEditForm(form, data) {
+      for (const [k,v] of Object.entries(data)) {
+        const el = form.querySelector(`[name="${k}"]`);
+        if (el) el.value = v || '';
+      }
+      form.dataset.original = JSON.stringify(toUpperObj(formToObj(form)));
+      form.dataset.rowVersion = data.row_version;
+    }
+
+    function changedFields(form, current) {
+      const original = JSON.parse(form.dataset.original || '{}');
+      const fields = {};
+      for (const [k,v] of Object.entries(current)) {
+        if ((original[k] || '') !== (v || '')) fields[k] = v;
+      }
+      return fields;
+    }
+
+    async function patchStencil(form, payload) {
+      const fields = changedFields(form, toUpperObj(formToObj(form)));
+      if (!Object.keys(fields).length) return { ok: true, changes: 0 };
+      const res = await fetch(`/api/stencil/${editModeId}`, {
+        method: 'PATCH',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          token: payload.token,
+          request_id: payload.request_id,
+          version: Number(form.dataset.rowVersion),
+          fields
+        })
+      });
+      if (res.status === 403) return { ok: false, error: 'Unauthorized: invalid credentials' };
+      const out = await res.json().catch(()=>({ ok: false }));
+      if (out.conflict && out.current) {
+        // someone else saved first: show their values, the user re-applies and saves again
+        fillEditForm(form, out.current);
+        form.dataset.requestId = newRequestId();
+      }
+      return out;
+    }
+
     // Save
     $('#saveBtn').on('click', async function(){
       const form = document.getElementById('stencilForm');
       if (!form.reportValidity()) return;
       const payload = toUpperObj(formToObj(form));
       payload.username = form.dataset.authUsername;
-      payload.password = form.dataset.authPassword;
-      if (!payload.username || !payload.password) {
+      payload.token = form.dataset.authToken;
+      payload.request_id = form.dataset.requestId;
+      if (!payload.username || !payload.token) {
         alert('Authentication required.');
         return;
       }
 
-      let url = '/api/add';
-      if (editModeId != null) url = `/api/update/${editModeId}`;
+      if (editModeId != null) {
+        const out = await patchStencil(form, payload);
+        if (out.ok) {
+          modal.hide();
+          table.ajax.reload(null, false);
+        } else {
+          alert(out.error || 'Save failed');
+        }
+        return;
+      }
 
-      const res = await fetch(url, {
+      const res = await fetch('/api/add', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload)
@@ -383,39 +442,66 @@ $(async function(){
       const out = await res.json();
       if (out.ok) {
         delete form.dataset.authUsername;
-        delete form.dataset.authPassword;
+        delete form.dataset.authToken;
         modal.hide();
         table.ajax.reload(null, false);
       } else {
-        alert('Save failed');
+        alert(out.error || 'Save failed');
       }
     });
 
     $('#editModal').on('hidden.bs.modal', function(){
       const form = document.getElementById('stencilForm');
       delete form.dataset.authUsername;
-      delete form.dataset.authPassword;
+      delete form.dataset.authToken;
+      delete form.dataset.original;
+      delete form.dataset.rowVersion;
     });
 
-    // History
-    $('#historyBtn').on('click', async function(){
-      if (!selectedRow) return;
-      const r = await fetch(`/api/history/${selectedRow.id}`);
-      const items = await r.json();
-      const body = document.getElementById('historyBody');
-      if (items.length === 0) {
-        body.innerHTML = '<div class="text-muted p-2">No history.</div>';
-      } else {
-        body.innerHTML = items.map(x => `
+    // History (loaded a page at a time)
+    let historyCursor = null;
+
+    function historyItemHtml(x) {
+      return `
           <div class="hist-item">
             <div class="small text-muted">${x.changed_at}</div>
             <div><strong>${x.changed_column}</strong></div>
             <div><span class="badge bg-secondary me-1">OLD</span> ${x.old_value ?? ''}</div>
             <div><span class="badge bg-primary me-1">NEW</span> ${x.new_value ?? ''}</div>
           </div>
-        `).join('');
+        `;
+    }
+
+    async function loadHistoryPage(stencilId) {
+      const body = document.getElementById('historyBody');
+      const params = new URLSearchParams({ limit: 50 });
+      if (historyCursor) params.set('cursor', historyCursor);
+      const r = await fetch(`/api/history/${stencilId}?${params}`);
+      const page = await r.json();
+      $('#historyMoreBtn').remove();
+      if (!historyCursor && page.rows.length === 0) {
+        body.innerHTML = '<div class="text-muted p-2">No history.</div>';
+        return;
+      }
+      body.insertAdjacentHTML('beforeend', page.rows.map(historyItemHtml).join(''));
+      historyCursor = page.next_cursor;
+      if (historyCursor) {
+        body.insertAdjacentHTML('beforeend',
+          '<button type="button" id="historyMoreBtn" class="btn btn-sm btn-outline-secondary w-100 my-2">Load more</button>');
+        $('#historyMoreBtn').on('click', () => loadHistoryPage(stencilId));
       }
+    }
+
+    $('#historyBtn').on('click', async function(){
+      if (!selectedRow) return;
+      const stencilId = selectedRow.id;
+      historyCursor = null;
+      document.getElementById('historyBody').innerHTML = '';
       showHistory();
+      fetch(`/api/history/${stencilId}/count`).then(r => r.json()).then(out => {
+        if (out.ok) $('#historyPanel .history-header strong').text(`History (${out.count})`);
+      });
+      await loadHistoryPage(stencilId);
     });
 
     // Actions (Move/Rework/Scrap)
@@ -427,8 +513,9 @@ $(async function(){
       const aform = document.getElementById('actionForm');
       if (creds) {
         aform.dataset.authUsername = creds.username;
-        aform.dataset.authPassword = creds.password;
+        aform.dataset.authToken = creds.token;
       }
+      aform.dataset.requestId = newRequestId();
       actionModal.show();
     }
 
@@ -455,8 +542,9 @@ $(async function(){
       const payload = toUpperObj(formToObj(form));
       payload.action = currentAction;
       payload.username = form.dataset.authUsername;
-      payload.password = form.dataset.authPassword;
-      if (!payload.username || !payload.password) {
+      payload.token = form.dataset.authToken;
+      payload.request_id = form.dataset.requestId;
+      if (!payload.username || !payload.token) {
         alert('Authentication required.');
         return;
       }
@@ -476,7 +564,7 @@ $(async function(){
       const out = await res.json();
       if (out.ok) {
         delete form.dataset.authUsername;
-        delete form.dataset.authPassword;
+        delete form.dataset.authToken;
         actionModal.hide();
         table.ajax.reload(null, false);
       } else {
@@ -487,7 +575,7 @@ $(async function(){
     $('#actionModal').on('hidden.bs.modal', function(){
       const aform = document.getElementById('actionForm');
       delete aform.dataset.authUsername;
-      delete aform.dataset.authPassword;
+      delete aform.dataset.authToken;
     });
 
     // Delete
@@ -499,7 +587,7 @@ $(async function(){
       const res = await fetch(`/api/delete/${selectedRow.id}`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(creds)
+        body: JSON.stringify({ ...creds, request_id: newRequestId() })
       });
       if (res.status === 403) {
         const b = await res.json().catch(()=>({}));
@@ -577,145 +665,20 @@ $(async function(){
       ],
       pageLength: 25,
       responsive: true,
+      // status_class / derived_status are computed and stored by the server
       rowCallback: function(row, data) {
         $(row).removeClass('case1 case2 case3 tension-red tension-pink');
-
-        const today = new Date();
-        const reval = new Date(Date.parse(data.stencil_revalidation_dt));
-        const diffDays = Math.ceil((reval - today) / (1000*60*60*24));
-
-        let condStatus = data.condition_status || "";
-
-        if (!isNaN(diffDays)) {
-          if (diffDays <= 1) {
-            $(row).addClass('case3');
-            condStatus = "REVALIDATION TIME END";
-          } else if (diffDays <= 5) {
-            $(row).addClass('case2');
-            condStatus = "RE-VALIDATION NEED TO DONE SOON";
-          } else if (diffDays <= 10) {
-            $(row).addClass('case1');
-            condStatus = "RE-VALIDATION NEED TO DONE SOON";
-          }
-        }
-
-        const tensions = [
-          parseFloat(data.tension_a),
-          parseFloat(data.tension_b),
-          parseFloat(data.tension_c),
-          parseFloat(data.tension_d),
-          parseFloat(data.tension_e)
-        ];
-        for (const t of tensions) {
-          if (!isNaN(t)) {
-            if (t < 35) {
-              $(row).addClass('tension-red');
-              condStatus = "STENCIL EOL";
-              break;
-            } else if (t === 35 || t === 36) {
-              $(row).addClass('tension-pink');
-              condStatus = "STENCIL RE-ORDER SOON";
-              break;
-            }
-          }
-        }
-
-        $('td:eq(14)', row).text(condStatus); // condition_status col
+        if (data.status_class) $(row).addClass(data.status_class);
+        $('td:eq(14)', row).text(data.derived_status || data.condition_status || ""); // condition_status col
       }
     });
   }
 
   // ---------------- DOWNLOAD EXCEL ----------------
-async function downloadExcel() {
-  try {
-    const [homeRes, recRes, statusRes, isosRes] = await Promise.allSettled([
-      fetch('/api/list').then(r => r.json()),
-      fetch('/api/received').then(r => r.json()),
-      fetch('/api/status').then(r => r.json()),
-      fetch('/api/isos_list').then(r => r.json())
-    ]);
-
-    if (homeRes.status !== "fulfilled") throw new Error("Home fetch failed");
-    if (recRes.status !== "fulfilled") throw new Error("Received fetch failed");
-    if (statusRes.status !== "fulfilled") throw new Error("Status fetch failed");
-    if (isosRes.status !== "fulfilled") throw new Error("ISOS fetch failed");
-
-    const wb = XLSX.utils.book_new();
-
-    // ✅ Formatter for date/time
-    function formatExcelDate(dateString) {
-      if (!dateString) return "";
-      const date = new Date(dateString);
-      if (isNaN(date)) return dateString; // fallback if not parseable
-      const day = String(date.getDate()).padStart(2, '0');
-      const month = String(date.getMonth() + 1).padStart(2, '0');
-      const year = date.getFullYear();
-      let hours = date.getHours();
-      const minutes = String(date.getMinutes()).padStart(2, '0');
-      const ampm = hours >= 12 ? 'PM' : 'AM';
-      hours = hours % 12 || 12;
-      return `${day}/${month}/${year} ${hours}:${minutes} ${ampm}`;
-    }
-
-    function makeSheet(data, cols, sheetName) {
-      const rows = data.map(r => cols.map(k => {
-        // ✅ Reformat all date/time fields ["date_received", "stencil_validation_dt", "stencil_revalidation_dt", "out_time", "in_time"]
-        if (["date_received", "stencil_validation_dt", "stencil_revalidation_dt", "out_time", "in_time"].includes(k)) {
-          return formatExcelDate(r[k]);
-        }
-        return r[k] ?? "";
-      }));
-
-      const aoa = [cols.map(c => c.toUpperCase()), ...rows];
-      aoa.push(["Stencil Master List"]);
-      const ws = XLSX.utils.aoa_to_sheet(aoa);
-
-      // Auto column widths
-      const colWidths = cols.map((c, i) => {
-        let maxLen = c.length;
-        rows.forEach(r => {
-          const val = r[i] ? String(r[i]) : "";
-          if (val.length > maxLen) maxLen = val.length;
-        });
-        return { wch: maxLen + 2 };
-      });
-      ws['!cols'] = colWidths;
-
-      XLSX.utils.book_append_sheet(wb, ws, sheetName);
-    }
-
-    // --- Sheets ---
-    makeSheet(homeRes.value, 
-      ["id","fg","side","customer","stencil_no","rack_no","location","condition_status","production_status"], 
-      "Home"
-    );
-
-    makeSheet(recRes.value, [
-      "id","fg","side","customer","stencil_no","rack_no","location",
-      "stencil_mils","stencil_mils_usl","stencil_mils_lsl","stencil_supplier",
-      "stencil_pr_no","date_received","stencil_validation_dt","stencil_revalidation_dt",
-      "tension_a","tension_b","tension_c","tension_d","tension_e",
-      "received_by","condition_status","production_status","remarks","emp_id"
-    ], "Received List");
-
-    makeSheet(statusRes.value, [
-      "fg","side","customer","stencil_no","rack_no","location",
-      "stencil_validation_dt","stencil_revalidation_dt",
-      "tension_a","tension_b","tension_c","tension_d","tension_e",
-      "remarks","condition_status","production_status","emp_id"
-    ], "Status");
-
-    makeSheet(isosRes.value, 
-      ["stencil_no","fg","customer","rack_no","location","out_time","in_time","remarks","status","operator_id"], 
-      "ISOS"
-    );
-
-    XLSX.writeFile(wb, "Stencil_Data.xlsx");
-    alert("✅ Excel downloaded successfully!");
-  } catch (err) {
-    console.error(err);
-    alert("❌ Excel download failed: " + err.message);
-  }
+function downloadExcel() {
+  // The workbook is built and streamed by the server (/api/export.xlsx), so the
+  // browser only saves the download; no data is loaded into the page.
+  window.location.href = "/api/export.xlsx";
 }
 
 $(document).ready(function () {
@@ -723,6 +686,21 @@ $(document).ready(function () {
   if (btn) btn.addEventListener("click", downloadExcel);
 });
 
+  // ---------------- ALERT BADGE ----------------
+  async function refreshAlertBadge() {
+    const badge = $("#alertBadge");
+    if (!badge.length) return;
+    try {
+      const out = await fetch("/api/alerts?limit=0").then(r => r.json());
+      const { critical, warning } = out.counts;
+      badge.text(`${critical} / ${warning}`).attr("title", `${critical} critical, ${warning} warning alerts`);
+      badge.toggleClass("d-none", critical + warning === 0);
+    } catch (err) {
+      console.warn("Alert badge refresh failed:", err);
+    }
+  }
+  refreshAlertBadge();
+
   // ---------------- ISOS PAGE ----------------
 if ($("#isosTable").length) {
   
@@ -772,6 +750,156 @@ if ($("#isosTable").length) {
 
   const modalEl = new bootstrap.Modal(document.getElementById("isosModal"));
   let currentAction = null; // OUT or IN
+  let currentRequestId = null; // reused until the scan is recorded
+
+  // ---------------- OFFLINE SCAN QUEUE ----------------
+  // Every submitted scan goes to IndexedDB first and is replayed to
+  // /api/isos_batch in order, so a dropped network never loses a scan.
+  const scanQueue = (() => {
+    const DB_NAME = "stencil_isos";
+    const STORE = "scan_queue";
+    let dbPromise = null;
+
+    function open() {
+      if (!dbPromise) {
+        dbPromise = new Promise((resolve, reject) => {
+          const req = indexedDB.open(DB_NAME, 1);
+          req.onupgradeneeded = () => req.result.createObjectStore(STORE, { keyPath: "seq", autoIncrement: true });
+          req.onsuccess = () => resolve(req.result);
+          req.onerror = () => reject(req.error);
+        });
+      }
+      return dbPromise;
+    }
+
+    async function run(mode, fn) {
+      const db = await open();
+      return new Promise((resolve, reject) => {
+        const tx = db.transaction(STORE, mode);
+        const result = fn(tx.objectStore(STORE));
+        tx.oncomplete = () => resolve(result && "result" in result ? result.result : undefined);
+        tx.onerror = () => reject(tx.error);
+      });
+    }
+
+    return {
+      add: item => run("readwrite", store => store.add(item)),
+      all: () => run("readonly", store => store.getAll()),
+      count: () => run("readonly", store => store.count()),
+      remove: seqs => run("readwrite", store => seqs.forEach(seq => store.delete(seq)))
+    };
+  })();
+
+  const QUEUE_BATCH_SIZE = 20;
+  const LOOKUP_TIMEOUT_MS = 3000;
+  let queuedScans = [];   // mirror of the IndexedDB queue for offline IN/OUT decisions
+  let flushing = false;
+  let serverReachable = true;   // false after a failed request, until one succeeds again
+
+  // Offline (or the last request failed): decide locally instead of waiting on timeouts.
+  function isOnline() {
+    return navigator.onLine && serverReachable;
+  }
+
+  async function refreshQueueBadge() {
+    queuedScans = await scanQueue.all();
+    const badge = $("#scanQueueBadge");
+    badge.text(`Pending scans: ${queuedScans.length}`);
+    badge.toggleClass("bg-warning text-dark", queuedScans.length > 0);
+    badge.toggleClass("bg-secondary", queuedScans.length === 0);
+  }
+
+  function reportConflicts(items) {
+    if (!items.length) return;
+    const lines = items.map(x => `${x.action} ${x.stencil_no}: ${x.error}`);
+    $("#scanConflicts").removeClass("d-none").append(lines.map(l => $("<div>").text(l)));
+  }
+
+  // Send queued scans in order; stop on network failure and retry later.
+  async function flushQueue() {
+    if (flushing) return;
+    flushing = true;
+    let recorded = 0;
+    try {
+      let pending = await scanQueue.all();
+      while (pending.length) {
+        const batch = pending.slice(0, QUEUE_BATCH_SIZE);
+        const res = await fetch("/api/isos_batch", {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ scans: batch.map(x => ({ ...x.payload, action: x.action })) })
+        });
+        serverReachable = true;
+        if (!res.ok) break;
+        const out = await res.json();
+
+        const done = [];
+        const conflicts = [];
+        for (let i = 0; i < out.results.length; i++) {
+          const r = out.results[i];
+          if (r.retry) break;
+          done.push(batch[i].seq);
+          if (r.ok) {
+            $("#scanLastResult").text(`✅ Stencil ${batch[i].action} recorded: ${batch[i].payload.stencil_no} (${r.status})`);
+          } else {
+            conflicts.push({ action: batch[i].action, stencil_no: batch[i].payload.stencil_no, error: r.error });
+          }
+        }
+        await scanQueue.remove(done);
+        recorded += done.length;
+        reportConflicts(conflicts);
+        if (done.length < batch.length) break;
+        pending = pending.slice(batch.length);
+      }
+    } catch (err) {
+      serverReachable = false;
+      console.warn("Scan queue replay deferred:", err);
+    } finally {
+      flushing = false;
+      if (recorded) isosTable.ajax.reload(null, false);
+      await refreshQueueBadge();
+    }
+  }
+
+  // Offline fallback: last queued scan for this stencil, else the table's open cycle.
+  function locallyOpen(stencilNo) {
+    for (let i = queuedScans.length - 1; i >= 0; i--) {
+      if (queuedScans[i].payload.stencil_no === stencilNo) return queuedScans[i].action === "OUT";
+    }
+    const rows = isosTable.rows().data().toArray();
+    const last = rows.find(r => r.stencil_no === stencilNo);
+    return !!(last && last.out_time && !last.in_time);
+  }
+
+  async function fetchWithTimeout(url, ms) {
+    const ctrl = new AbortController();
+    const timer = setTimeout(() => ctrl.abort(), ms);
+    try {
+      return await fetch(url, { signal: ctrl.signal });
+    } finally {
+      clearTimeout(timer);
+    }
+  }
+
+  // Operator list for the Save check, kept in localStorage so offline saves don't wait on it
+  let operators = JSON.parse(localStorage.getItem("isosOperators") || "null");
+
+  async function refreshOperators() {
+    if (!isOnline()) return;
+    try {
+      const res = await fetchWithTimeout(`/api/operators`, LOOKUP_TIMEOUT_MS);
+      operators = await res.json();
+      serverReachable = true;
+      localStorage.setItem("isosOperators", JSON.stringify(operators));
+    } catch (err) {
+      serverReachable = false;
+    }
+  }
+
+  window.addEventListener("online", () => { serverReachable = true; flushQueue(); });
+  setInterval(() => { if (queuedScans.length) flushQueue(); }, 15000);
+  refreshQueueBadge().then(flushQueue);
+  refreshOperators();
 
   // Scan handler
   $("#scanInput").on("keypress", async function (e) {
@@ -781,10 +909,19 @@ if ($("#isosTable").length) {
       if (!stencilNo) return;
 
       try {
-        const res = await fetch(`/api/isos_lookup/${encodeURIComponent(stencilNo)}`);
-        const data = await res.json();
+        let data = null;
+        if (isOnline()) {
+          try {
+            const res = await fetchWithTimeout(`/api/isos_lookup/${encodeURIComponent(stencilNo)}`, LOOKUP_TIMEOUT_MS);
+            data = await res.json();
+            serverReachable = true;
+          } catch (netErr) {
+            serverReachable = false;
+            data = null; // server unreachable → decide IN/OUT locally, server re-checks on replay
+          }
+        }
 
-        if (!data.ok) {
+        if (data && !data.ok) {
           alert(data.error || "Stencil not found");
           return;
         }
@@ -796,21 +933,29 @@ if ($("#isosTable").length) {
           "STENCIL EOL", "STENCIL RE-ORDER SOON"
         ];
 
-        if (data.stencil.condition_status && blockedStatuses.includes(data.stencil.condition_status.toUpperCase())) {
-          alert(`❌ Access Denied: Stencil is in Condition Status "${data.stencil.condition_status}"`);
+        const gateStatus = data && !data.active_cycle && data.stencil.derived_status
+          ? data.stencil.derived_status
+          : data && data.stencil.condition_status;
+        if (gateStatus && blockedStatuses.includes(gateStatus.toUpperCase())) {
+          alert(`❌ Access Denied: Stencil is in Condition Status "${gateStatus}"`);
           $(this).val("");
           return;
         }
 
         // ✅ Allowed → fill form
         $("#stencil_no").val(stencilNo);
+        currentRequestId = newRequestId();
 
-        if (data.active_cycle) {
+        // scans still queued for this stencil aren't on the server yet: they decide first
+        const queued = queuedScans.some(x => x.payload.stencil_no === stencilNo);
+        const open = data && !queued ? !!data.active_cycle : locallyOpen(stencilNo);
+        const suffix = data ? "" : " (offline)";
+        if (open) {
           currentAction = "IN";
-          $("#isosModalTitle").text(`Scan IN: ${stencilNo}`);
+          $("#isosModalTitle").text(`Scan IN: ${stencilNo}${suffix}`);
         } else {
           currentAction = "OUT";
-          $("#isosModalTitle").text(`Scan OUT: ${stencilNo}`);
+          $("#isosModalTitle").text(`Scan OUT: ${stencilNo}${suffix}`);
         }
 
         modalEl.show();
@@ -826,41 +971,24 @@ if ($("#isosTable").length) {
   // Save handler
   $("#isosSubmitBtn").on("click", async function () {
     const formData = Object.fromEntries(new FormData(document.getElementById("isosForm")));
+    formData.request_id = currentRequestId;
+    formData.scanned_at = new Date().toISOString();
     const opId = formData.operator_id ? formData.operator_id.trim().toUpperCase() : "";
 
     // 🚨 Validate operator ID . Only OP-USER1 … OP-USER20 
-    try {
-      const resOp = await fetch(`/api/operators`);
-      const operators = await resOp.json();
-
-      const validIds = operators.map(o => o.operator_id.toUpperCase());
-      if (!validIds.includes(opId)) {
-        alert("❌ Invalid Operator ID are Notallowed.");
-        return;
-      }
-    } catch (err) {
-      console.error("Operator validation failed:", err);
-      alert("Could not validate operator ID");
+    // (cached list; refetched only when it's missing or doesn't know the ID, the server validates again on replay)
+    const knownOperator = () => operators.some(o => o.operator_id.toUpperCase() === opId);
+    if (!operators || !knownOperator()) await refreshOperators();
+    if (operators && !knownOperator()) {
+      alert("❌ Invalid Operator ID are Notallowed.");
       return;
     }
 
     try {
-      const url = currentAction === "OUT" ? "/api/isos_out" : "/api/isos_in";
-      const res = await fetch(url, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(formData)
-      });
-      const data = await res.json();
-
-      if (!data.ok) {
-        alert(data.error || "Error saving");
-        return;
-      }
-
-      alert(`✅ Stencil ${currentAction} recorded: ${data.status}`);
+      await scanQueue.add({ action: currentAction, payload: formData });
+      await refreshQueueBadge();
       modalEl.hide();
-      isosTable.ajax.reload(null, false);
+      flushQueue();
     } catch (err) {
       console.error(err);
       alert("Save failed");
@@ -868,4 +996,5 @@ if ($("#isosTable").length) {
   });
 }
 
+
 });